@@ -0,0 +1,4 @@
+import artifacts
+from benchmark import Benchmark
+from fake_curses import FakeCurses
+from suite import Suite
@@ -0,0 +1,57 @@
+import os
+
+
+SUCCESS_LINE = 'BUILD SUCCESSFUL in 42s\n'
+SUCCESS_PATTERN = '^BUILD SUCCESSFUL'
+
+# Enough distinct lines that a block of them looks like a real build log.
+FILLER_LINE_COUNT = 1000
+
+
+def generate_tree(root, file_count, files_per_directory=1000):
+    """
+    Create @file_count small files beneath @root, spread over
+    subdirectories of at most @files_per_directory each, returning their
+    filenames.
+    """
+    filenames = []
+    for index in range(file_count):
+        dirname = os.path.join(root, 'dir_%05d' % (index // files_per_directory))
+        if index % files_per_directory == 0 and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        filename = os.path.join(dirname, 'artifact_%07d.js' % index)
+        with open(filename, 'w') as handle:
+            handle.write('/* artifact %d */\n' % index)
+        filenames.append(filename)
+
+    return filenames
+
+
+def generate_log(filename, size_bytes, is_success):
+    """
+    Write a build log of @size_bytes made of ordinary compiler chatter,
+    ending in a success line if @is_success. The success line comes last
+    so that a forward scan has to read everything to find it.
+    """
+    block = _filler_block()
+    success_line = SUCCESS_LINE if is_success else ''
+    remaining = max(0, size_bytes - len(success_line))
+    with open(filename, 'wb') as handle:
+        while remaining >= len(block):
+            handle.write(block)
+            remaining -= len(block)
+        # Finish the filler on a line boundary, padding the last line.
+        if remaining:
+            handle.write('#' * (remaining - 1) + '\n')
+        handle.write(success_line)
+
+    return filename
+
+
+def _filler_block():
+    lines = []
+    for index in range(FILLER_LINE_COUNT):
+        lines.append('[%05d] compiling src/module_%04d.js (%d ms) SUCCESS rate %d%%\n' % (
+            index, index * 7 % 9973, index * 13 % 997, index % 100))
+
+    return ''.join(lines)
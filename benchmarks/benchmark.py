@@ -0,0 +1,117 @@
+import argparse
+import json
+import re
+import sys
+import time
+
+from suite import Suite
+
+
+class Benchmark:
+    SCRIPT_ABBREV = 'bench'
+
+    SIZE_PATTERN = re.compile('^([0-9]+)([KMG]?)$', re.IGNORECASE)
+    SIZE_MULTIPLIERS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+    @staticmethod
+    def build_arg_parser():
+        description = 'Time the hot paths of the file age dashboard against synthetic artifacts.'
+        arg_parser = argparse.ArgumentParser(description)
+        arg_parser.add_argument('--output',
+                                dest='output_filename',
+                                help='file to write the JSON results to, instead of stdout')
+        arg_parser.add_argument('--compare',
+                                dest='baseline_filename',
+                                help='JSON results of an earlier run, to report regressions against')
+        arg_parser.add_argument('--threshold',
+                                dest='regression_threshold',
+                                type=float,
+                                default=Suite.DEFAULT_REGRESSION_THRESHOLD,
+                                help='how many times slower than the baseline counts as a regression')
+        arg_parser.add_argument('--work-dir',
+                                dest='work_dirname',
+                                help='directory to generate artifacts in')
+        arg_parser.add_argument('--file-counts',
+                                dest='file_counts',
+                                help='comma separated file counts for get_statuses, e.g. 10,1000,100000')
+        arg_parser.add_argument('--scan-sizes',
+                                dest='scan_sizes',
+                                help='comma separated log sizes for _check_patterns, e.g. 1M,16M,1G')
+        arg_parser.add_argument('--cell-counts',
+                                dest='cell_counts',
+                                help='comma separated cell counts for the dashboard, e.g. 10,100,1000')
+        arg_parser.add_argument('--repeat',
+                                dest='repeat',
+                                type=int,
+                                default=Suite.DEFAULT_REPEAT,
+                                help='samples to take of each benchmark')
+
+        return arg_parser
+
+    @staticmethod
+    def register_services(runtime):
+        pass
+
+    @staticmethod
+    def is_config_required():
+        return False
+
+    @staticmethod
+    def configure_log(log, options):
+        # Keep stdout clean for the results when it's the destination.
+        if not options.output_filename:
+            log.set_output_handle(sys.stderr)
+
+    def run(self, runtime):
+        options = runtime.options
+        suite = Suite()
+        suite.set_log(runtime.log)
+        suite.set_repeat(options.repeat)
+        if options.work_dirname:
+            suite.set_work_dirname(options.work_dirname)
+        if options.file_counts:
+            suite.set_file_counts([int(count) for count in options.file_counts.split(',')])
+        if options.scan_sizes:
+            suite.set_scan_sizes([Benchmark._parse_size(size) for size in options.scan_sizes.split(',')])
+        if options.cell_counts:
+            suite.set_cell_counts([int(count) for count in options.cell_counts.split(',')])
+
+        results = suite.run()
+        report = {
+            'time': time.time(),
+            'python-version': '%d.%d.%d' % sys.version_info[:3],
+            'platform': sys.platform,
+            'results': results
+        }
+
+        if options.output_filename:
+            with open(options.output_filename, 'w') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+        else:
+            json.dump(report, sys.stdout, indent=2, sort_keys=True)
+            sys.stdout.write('\n')
+
+        if options.baseline_filename:
+            with open(options.baseline_filename) as handle:
+                baseline = json.load(handle)
+            regressions = Suite.find_regressions(results, baseline['results'],
+                                                 options.regression_threshold)
+            for regression in regressions:
+                runtime.log.warning('regression in %s %s: median %.6fs vs %.6fs (%.2fx)',
+                                    regression['name'],
+                                    json.dumps(regression['parameters'], sort_keys=True),
+                                    regression['median-seconds'],
+                                    regression['baseline-median-seconds'],
+                                    regression['ratio'])
+            if regressions:
+                return 1
+
+        return 0
+
+    @staticmethod
+    def _parse_size(size):
+        match = Benchmark.SIZE_PATTERN.match(size.strip())
+        if not match:
+            raise Exception('unknown size: %s' % size)
+
+        return int(match.group(1)) * Benchmark.SIZE_MULTIPLIERS[match.group(2).upper()]
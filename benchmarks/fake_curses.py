@@ -0,0 +1,106 @@
+class FakeCurses(object):
+    """
+    Class to stand in for the curses module, so the dashboard's drawing
+    can be timed without a terminal. Nothing is drawn, but every call the
+    dashboard makes is counted.
+    """
+
+    class error(Exception):
+        pass
+
+    KEY_NPAGE = 338
+    KEY_PPAGE = 339
+    KEY_DOWN = 258
+    KEY_UP = 259
+    KEY_HOME = 262
+    KEY_END = 360
+    KEY_RESIZE = 410
+    KEY_ENTER = 343
+    KEY_BACKSPACE = 263
+
+    COLOR_BLACK = 0
+    COLOR_RED = 1
+    COLOR_GREEN = 2
+    COLOR_YELLOW = 3
+    COLOR_MAGENTA = 5
+    COLOR_CYAN = 6
+    COLOR_WHITE = 7
+
+    A_REVERSE = 1 << 18
+
+    def __init__(self, height=50, width=200):
+        self._height = height
+        self._width = width
+        self.reset_counts()
+
+    def reset_counts(self):
+        self.addstr_count = 0
+        self.noutrefresh_count = 0
+        self.doupdate_count = 0
+
+    def get_counts(self):
+        return {
+            'addstr-count': self.addstr_count,
+            'noutrefresh-count': self.noutrefresh_count,
+            'doupdate-count': self.doupdate_count
+        }
+
+    def initscr(self):
+        return FakeWindow(self, self._height, self._width)
+
+    def newwin(self, height, width, row, col):
+        return FakeWindow(self, height, width)
+
+    def doupdate(self):
+        self.doupdate_count += 1
+
+    def color_pair(self, number):
+        return number << 8
+
+    def init_pair(self, number, foreground, background):
+        pass
+
+    def resizeterm(self, height, width):
+        self._height = height
+        self._width = width
+
+
+class FakeWindow(object):
+
+    def __init__(self, fake_curses, height, width):
+        self._fake_curses = fake_curses
+        self._height = height
+        self._width = width
+
+    def getmaxyx(self):
+        return (self._height, self._width)
+
+    def resize(self, height, width):
+        self._height = height
+        self._width = width
+
+    def mvwin(self, row, col):
+        pass
+
+    def addstr(self, row, col, text, attr=0):
+        if row >= self._height or col + len(text) > self._width:
+            raise FakeCurses.error('addstr() returned ERR')
+        self._fake_curses.addstr_count += 1
+
+    def erase(self):
+        pass
+
+    def bkgd(self, attr):
+        pass
+
+    def noutrefresh(self):
+        self._fake_curses.noutrefresh_count += 1
+
+    def getch(self):
+        return -1
+
+    def keypad(self, flag):
+        pass
+
+    def nodelay(self, flag):
+        pass
@@ -0,0 +1,252 @@
+import os
+import shutil
+import tempfile
+import time
+
+import artifacts
+from fake_curses import FakeCurses
+from fileage import CursesDashboard
+from fileage import Status
+from fileage import StatusRecord
+from fileage import constants
+from fileage.watcher import PollingWatcher
+import fileage.curses_dashboard
+
+
+class Suite(object):
+    """
+    Class to time the hot paths of Status and CursesDashboard against
+    synthetic artifacts, producing results which can be saved as JSON
+    and compared between runs.
+    """
+
+    DEFAULT_FILE_COUNTS = [10, 1000, 100000]
+    DEFAULT_SCAN_SIZES = [1 << 20, 16 << 20, 256 << 20, 1 << 30]
+    DEFAULT_CELL_COUNTS = [10, 100, 1000]
+    DEFAULT_REPEAT = 5
+
+    # Results slower than their baseline by more than this are regressions.
+    DEFAULT_REGRESSION_THRESHOLD = 1.25
+
+    def __init__(self):
+        self._log = None
+        self._work_dirname = None
+        self._file_counts = Suite.DEFAULT_FILE_COUNTS
+        self._scan_sizes = Suite.DEFAULT_SCAN_SIZES
+        self._cell_counts = Suite.DEFAULT_CELL_COUNTS
+        self._repeat = Suite.DEFAULT_REPEAT
+
+    def set_log(self, log):
+        self._log = log
+
+    def set_work_dirname(self, work_dirname):
+        """
+        Generate artifacts beneath @work_dirname rather than the system
+        temporary directory, which may be too small or on a RAM disk.
+        """
+        self._work_dirname = work_dirname
+
+    def set_file_counts(self, file_counts):
+        self._file_counts = file_counts
+
+    def set_scan_sizes(self, scan_sizes):
+        self._scan_sizes = scan_sizes
+
+    def set_cell_counts(self, cell_counts):
+        self._cell_counts = cell_counts
+
+    def set_repeat(self, repeat):
+        self._repeat = repeat
+
+    def run(self):
+        results = []
+        root = tempfile.mkdtemp(prefix='fileage-benchmark-', dir=self._work_dirname)
+        try:
+            for file_count in self._file_counts:
+                results.append(self._bench_get_statuses(root, file_count))
+            for size_bytes in self._scan_sizes:
+                for is_success in (True, False):
+                    results.append(self._bench_file_is_success(root, size_bytes, is_success))
+            for cell_count in self._cell_counts:
+                for is_changing in (False, True):
+                    results.append(self._bench_dashboard(cell_count, is_changing))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+        return results
+
+    @staticmethod
+    def find_regressions(results, baseline_results, threshold=None):
+        """
+        Pair each result with the one in @baseline_results taken with the
+        same parameters, returning those whose median grew by more than
+        @threshold times.
+        """
+        threshold = threshold or Suite.DEFAULT_REGRESSION_THRESHOLD
+        baselines = dict((Suite._result_key(result), result) for result in baseline_results)
+        regressions = []
+        for result in results:
+            baseline = baselines.get(Suite._result_key(result))
+            if not baseline or not baseline['median-seconds']:
+                continue
+            ratio = result['median-seconds'] / baseline['median-seconds']
+            if ratio > threshold:
+                regressions.append({
+                    'name': result['name'],
+                    'parameters': result['parameters'],
+                    'median-seconds': result['median-seconds'],
+                    'baseline-median-seconds': baseline['median-seconds'],
+                    'ratio': ratio
+                })
+
+        return regressions
+
+    @staticmethod
+    def _result_key(result):
+        return (result['name'], tuple(sorted(result['parameters'].items())))
+
+    def _bench_get_statuses(self, root, file_count):
+        self._info('generating %d files', file_count)
+        dirname = os.path.join(root, 'tree_%d' % file_count)
+        filenames = artifacts.generate_tree(dirname, file_count)
+
+        status = Status()
+        for filename in filenames:
+            status.add_filename(filename)
+        try:
+            self._info('timing get_statuses over %d files', file_count)
+            started = time.time()
+            status.get_statuses()
+            first_seconds = time.time() - started
+            samples = self._measure(status.get_statuses)
+        finally:
+            status.close()
+        shutil.rmtree(dirname, ignore_errors=True)
+
+        return self._summarize('get-statuses', {'file-count': file_count}, samples, {
+            'first-call-seconds': first_seconds,
+            'files-per-second': file_count / Suite._median(samples)
+        })
+
+    def _bench_file_is_success(self, root, size_bytes, is_success):
+        self._info('generating a %d byte log', size_bytes)
+        filename = artifacts.generate_log(os.path.join(root, 'build.log'), size_bytes, is_success)
+        stat = os.stat(filename)
+
+        def check():
+            # A new Status each time, so the success cache never answers.
+            status = Status()
+            status.add_filename(filename, artifacts.SUCCESS_PATTERN, constants.ScanModes.FULL)
+            assert status._check_patterns(filename, filename, stat)[0] == is_success
+        try:
+            self._info('timing _check_patterns on %d bytes', size_bytes)
+            samples = self._measure(check)
+        finally:
+            os.unlink(filename)
+
+        return self._summarize('file-is-success', {
+            'size-bytes': size_bytes,
+            'is-success': is_success
+        }, samples, {
+            'megabytes-per-second': size_bytes / float(1 << 20) / Suite._median(samples)
+        })
+
+    def _bench_dashboard(self, cell_count, is_changing):
+        """
+        Time one tick of the dashboard, updating and redrawing @cell_count
+        cells, either all changing state every tick or none of them.
+        """
+        self._info('timing the dashboard with %d cells', cell_count)
+        fake_curses = FakeCurses()
+        real_curses = fileage.curses_dashboard.curses
+        fileage.curses_dashboard.curses = fake_curses
+        try:
+            dashboard = CursesDashboard()
+            statuses = {}
+            for index in range(cell_count):
+                filename = 'artifact_%07d.js' % index
+                dashboard.add_cell(filename)
+                statuses[filename] = StatusRecord()
+                statuses[filename].state = constants.States.NEW
+            dashboard.set_status(_FixedStatus(statuses))
+            dashboard.set_watcher(PollingWatcher())
+            dashboard._stdscr = fake_curses.initscr()
+            dashboard._setup_cell_windows()
+            dashboard._update_statuses()
+            dashboard._redraw()
+            fake_curses.reset_counts()
+
+            def tick():
+                if is_changing:
+                    for status in statuses.itervalues():
+                        if status.state == constants.States.NEW:
+                            status.state = constants.States.OLD
+                        else:
+                            status.state = constants.States.NEW
+                dashboard._update_statuses()
+                dashboard._redraw()
+            samples = self._measure(tick)
+        finally:
+            fileage.curses_dashboard.curses = real_curses
+
+        counts = fake_curses.get_counts()
+        extra = dict((key, value / float(len(samples))) for key, value in counts.iteritems())
+
+        return self._summarize('dashboard-tick', {
+            'cell-count': cell_count,
+            'is-changing': is_changing
+        }, samples, extra)
+
+    def _measure(self, function):
+        samples = []
+        for _ in range(self._repeat):
+            started = time.time()
+            function()
+            samples.append(time.time() - started)
+
+        return samples
+
+    def _summarize(self, name, parameters, samples, extra=None):
+        result = {
+            'name': name,
+            'parameters': parameters,
+            'samples': samples,
+            'min-seconds': min(samples),
+            'median-seconds': Suite._median(samples),
+            'mean-seconds': sum(samples) / len(samples)
+        }
+        result.update(extra or {})
+
+        return result
+
+    @staticmethod
+    def _median(samples):
+        ordered = sorted(samples)
+        middle = len(ordered) // 2
+        if len(ordered) % 2:
+            return ordered[middle]
+
+        return (ordered[middle - 1] + ordered[middle]) / 2.0
+
+    def _info(self, message, *args):
+        if self._log:
+            self._log.info(message, *args)
+
+
+class _FixedStatus(object):
+    """
+    Class to hand the dashboard the same statuses every tick, so that
+    only the dashboard's own work is timed.
+    """
+
+    def __init__(self, statuses):
+        self._statuses = statuses
+
+    def get_statuses(self, changed_filenames=None, closed_filenames=None):
+        return self._statuses
+
+    def get_transition_time(self, status):
+        return None
+
+    def get_next_check_time(self):
+        return None
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+
+"""
+Script to time the hot paths of the file age dashboard
+"""
+import inspect
+import sys
+import os
+
+# Build up the path to our code so that we can import it.
+this_file_path = inspect.getfile(inspect.currentframe())
+this_file_home = os.path.dirname(this_file_path)
+project_home = os.path.join(this_file_home, '..')
+project_home = os.path.abspath(project_home)
+sys.path.append(project_home)
+
+from runtime import Runtime
+from benchmarks import Benchmark
+
+if __name__ == "__main__":
+    exit_status = Runtime.run_command(Benchmark, project_home, os.getcwd())
+    exit(exit_status)
+
+
+
+
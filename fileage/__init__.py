@@ -1,4 +1,15 @@
 
+import classifier
 import constants
+import watcher
+from config_reloader import ConfigReloader
 from curses_dashboard import CursesDashboard
+from history import History
+from metrics import Metrics
+from ndjson_stream import NdjsonStream
+from remote_status import RemoteStatus
+from remote_status import RemoteWatcher
+from state_snapshot import StateSnapshot
 from status import Status
+from status_daemon import StatusDaemon
+from status_record import StatusRecord
@@ -0,0 +1,71 @@
+import collections
+import threading
+
+
+def fingerprint(stat):
+    """
+    Summarize a stat result into a value which changes whenever the
+    file's content is likely to have changed.
+    """
+    return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+
+class FingerprintCache(object):
+    """
+    Class to remember one result per filename for as long as the file's
+    fingerprint stays the same, evicting the least recently used entries
+    once it holds more than `max_entries`. Safe to share between threads.
+    """
+    DEFAULT_MAX_ENTRIES = 4096
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self._entries = collections.OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def set_max_entries(self, max_entries):
+        with self._lock:
+            self._max_entries = max_entries
+            self._evict()
+
+    def get(self, filename, fingerprint, default=None):
+        with self._lock:
+            entry = self._entries.pop(filename, None)
+            if entry is None:
+                return default
+
+            # Re-insert to mark the entry as most recently used.
+            self._entries[filename] = entry
+        if entry[0] != fingerprint:
+            return default
+
+        return entry[1]
+
+    def put(self, filename, fingerprint, value):
+        with self._lock:
+            self._entries.pop(filename, None)
+            self._entries[filename] = (fingerprint, value)
+            self._evict()
+
+    def peek(self, filename):
+        """
+        Return the fingerprint and result kept for @filename, if any,
+        without marking it as used.
+        """
+        with self._lock:
+            return self._entries.get(filename)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def discard(self, filename):
+        with self._lock:
+            self._entries.pop(filename, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self):
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
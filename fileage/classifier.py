@@ -0,0 +1,189 @@
+import bisect
+
+import constants
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+CLASSIFIER_AUTO = 'auto'
+CLASSIFIER_NUMPY = 'numpy'
+CLASSIFIER_PYTHON = 'python'
+
+
+def create_classifier(kind=None):
+    """
+    Build the classifier for @kind: 'auto' prefers NumPy and falls back
+    to pure Python, 'numpy' insists upon it.
+    """
+    kind = kind or CLASSIFIER_AUTO
+    if kind not in (CLASSIFIER_AUTO, CLASSIFIER_NUMPY, CLASSIFIER_PYTHON):
+        raise Exception('unknown classifier: %s' % kind)
+
+    if kind != CLASSIFIER_PYTHON:
+        if numpy is not None:
+            return NumpyClassifier()
+        elif kind == CLASSIFIER_NUMPY:
+            raise Exception('numpy is not installed')
+
+    return PythonClassifier()
+
+
+class PythonClassifier(object):
+    """
+    Class to find the state of every file at once from what was last seen
+    of it, reporting only the files whose state changed since the last
+    time we were asked.
+
+    Files are known by the index they were added at.
+    """
+
+    def __init__(self):
+        self._thresholds = [3, 10]
+        self._modified_times = []
+        self._is_successes = []
+        self._is_writings = []
+        self._states = []
+
+    def set_age_thresholds(self, new_age_seconds, young_age_seconds):
+        self._thresholds = [new_age_seconds, young_age_seconds]
+
+    def add(self):
+        self._modified_times.append(None)
+        self._is_successes.append(False)
+        self._is_writings.append(False)
+        self._states.append(constants.States.NO_INFO)
+
+        return len(self._states) - 1
+
+    def remove(self, index):
+        """
+        Forget the file at @index by moving the last file into its place.
+        """
+        for values in (self._modified_times, self._is_successes, self._is_writings, self._states):
+            values[index] = values[-1]
+            values.pop()
+
+    def update(self, index, modified_time, is_success, is_writing=False):
+        """
+        Record what a check of the file at @index found; a @modified_time
+        of None means there was no file to be found.
+        """
+        self._modified_times[index] = modified_time
+        self._is_successes[index] = is_success
+        self._is_writings[index] = is_writing
+
+    def classify(self, now):
+        """
+        Return every file's state as of @now, and the indices of those
+        whose state changed since the last call.
+        """
+        state_by_bucket = (constants.States.NEW, constants.States.YOUNG, constants.States.OLD)
+        thresholds = self._thresholds
+        changed = []
+        for index, modified_time in enumerate(self._modified_times):
+            if modified_time is None:
+                state = constants.States.NO_INFO
+            elif self._is_writings[index]:
+                state = constants.States.WRITING
+            elif not self._is_successes[index]:
+                state = constants.States.ERROR
+            else:
+                state = state_by_bucket[bisect.bisect_right(thresholds, now - modified_time)]
+            if state != self._states[index]:
+                self._states[index] = state
+                changed.append(index)
+
+        return (self._states, changed)
+
+
+class NumpyClassifier(object):
+    """
+    Class to find the state of every file at once in a single vectorized
+    pass over arrays of what was last seen of each, reporting only the
+    files whose state changed since the last time we were asked.
+
+    Files are known by the index they were added at. A missing file has
+    a modified time of NaN.
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self):
+        self._thresholds = numpy.array([3, 10], dtype=numpy.float64)
+        self._state_by_bucket = numpy.array([constants.States.NEW,
+                                             constants.States.YOUNG,
+                                             constants.States.OLD], dtype=numpy.int8)
+        self._count = 0
+        self._modified_times = numpy.empty(0, dtype=numpy.float64)
+        self._is_successes = numpy.empty(0, dtype=numpy.bool_)
+        self._is_writings = numpy.empty(0, dtype=numpy.bool_)
+        self._states = numpy.empty(0, dtype=numpy.int8)
+        self._grow(NumpyClassifier.INITIAL_CAPACITY)
+
+    def set_age_thresholds(self, new_age_seconds, young_age_seconds):
+        self._thresholds = numpy.array([new_age_seconds, young_age_seconds], dtype=numpy.float64)
+
+    def add(self):
+        if self._count == len(self._states):
+            self._grow(2 * len(self._states))
+        index = self._count
+        self._count += 1
+
+        return index
+
+    def remove(self, index):
+        """
+        Forget the file at @index by moving the last file into its place.
+        """
+        self._count -= 1
+        last = self._count
+        for values in (self._modified_times, self._is_successes, self._is_writings, self._states):
+            values[index] = values[last]
+        self._modified_times[last] = numpy.nan
+        self._is_successes[last] = False
+        self._is_writings[last] = False
+        self._states[last] = constants.States.NO_INFO
+
+    def update(self, index, modified_time, is_success, is_writing=False):
+        """
+        Record what a check of the file at @index found; a @modified_time
+        of None means there was no file to be found.
+        """
+        if modified_time is None:
+            modified_time = float('nan')
+        self._modified_times[index] = modified_time
+        self._is_successes[index] = bool(is_success)
+        self._is_writings[index] = is_writing
+
+    def classify(self, now):
+        """
+        Return every file's state as of @now, and the indices of those
+        whose state changed since the last call.
+        """
+        count = self._count
+        modified_times = self._modified_times[:count]
+        # NaN ages sort after every threshold, and are marked missing below.
+        buckets = numpy.searchsorted(self._thresholds, now - modified_times, side='right')
+        states = self._state_by_bucket[buckets]
+        states[~self._is_successes[:count]] = constants.States.ERROR
+        states[self._is_writings[:count]] = constants.States.WRITING
+        states[numpy.isnan(modified_times)] = constants.States.NO_INFO
+
+        changed = numpy.flatnonzero(states != self._states[:count])
+        self._states[:count] = states
+
+        return (self._states, changed.tolist())
+
+    def _grow(self, capacity):
+        extra = capacity - len(self._states)
+        self._modified_times = numpy.concatenate(
+            [self._modified_times, numpy.full(extra, numpy.nan)])
+        self._is_successes = numpy.concatenate(
+            [self._is_successes, numpy.zeros(extra, dtype=numpy.bool_)])
+        self._is_writings = numpy.concatenate(
+            [self._is_writings, numpy.zeros(extra, dtype=numpy.bool_)])
+        self._states = numpy.concatenate(
+            [self._states, numpy.full(extra, constants.States.NO_INFO, dtype=numpy.int8)])
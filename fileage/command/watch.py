@@ -6,14 +6,27 @@ import sys
 import time
 
 from runtime import Log
+from fileage import ConfigReloader
 from fileage import CursesDashboard
+from fileage import History
+from fileage import Metrics
+from fileage import NdjsonStream
+from fileage import RemoteStatus
+from fileage import RemoteWatcher
+from fileage import StateSnapshot
 from fileage import Status
+from fileage import StatusDaemon
+from fileage import classifier
+from fileage import watcher
 
 class Watch:
     SCRIPT_ABBREV = 'dash'
     CONFIG_SECTION_NAME = 'fileage'
     DOTFILE_NAME = '.fileage'
 
+    FORMAT_CURSES = 'curses'
+    FORMAT_NDJSON = 'ndjson'
+
     def __init__(self):
         self._dashboard = None
 
@@ -28,6 +41,24 @@ class Watch:
         arg_parser.add_argument('-s',
                                 dest='success_pattern_string',
                                 help='regexp indicating a successful build')
+        arg_parser.add_argument('-F',
+                                dest='failure_pattern_strings',
+                                action='append',
+                                help='regexp or plain string indicating a failed build')
+        arg_parser.add_argument('--format',
+                                dest='output_format',
+                                default=Watch.FORMAT_CURSES,
+                                choices=[Watch.FORMAT_CURSES, Watch.FORMAT_NDJSON],
+                                help='show a dashboard, or stream state transitions as JSON lines')
+        arg_parser.add_argument('--output',
+                                dest='output_filename',
+                                help='file or FIFO to stream to with --format ndjson, instead of stdout')
+        arg_parser.add_argument('--serve',
+                                dest='serve_filename',
+                                help='scan in the background, publishing to dashboards on this Unix socket')
+        arg_parser.add_argument('--connect',
+                                dest='connect_filename',
+                                help='show the dashboard of the daemon serving this Unix socket')
 
         return arg_parser
 
@@ -39,84 +70,303 @@ class Watch:
     def is_config_required():
         return False
 
+    @staticmethod
+    def configure_log(log, options):
+        # Keep stdout clean for the stream when it's the destination.
+        if (options.output_format == Watch.FORMAT_NDJSON and
+                not options.output_filename and not options.log_filename):
+            log.set_output_handle(sys.stderr)
+
     def run(self, runtime):
+        if runtime.options.connect_filename:
+            self._run_client(runtime)
+            return
+
+        metrics = self._build_metrics(runtime)
         status = Status()
+        status.set_metrics(metrics)
+        self._configure_status(runtime, status)
+        history = None
 
-        self._dashboard = CursesDashboard()
+        if runtime.options.serve_filename:
+            self._dashboard = StatusDaemon()
+            self._dashboard.set_socket_filename(runtime.options.serve_filename)
+            self._dashboard.set_log(runtime.log)
+        elif runtime.options.output_format == Watch.FORMAT_NDJSON:
+            self._dashboard = NdjsonStream()
+            if runtime.options.output_filename:
+                self._dashboard.set_output_filename(runtime.options.output_filename)
+        else:
+            self._dashboard = CursesDashboard()
+            self._configure_curses_dashboard(runtime, self._dashboard)
+            history = self._configure_history(runtime, status, self._dashboard)
+            # Keep the keys live while a huge file is scanned, checking the
+            # rest inline, where it's quicker. A one-off dump waits for every
+            # check instead.
+            if (not runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'worker-count') and
+                    runtime.options.log_level != Log.LEVEL_DEBUG):
+                status.set_worker_count(1, is_scanning_only_on_workers=True)
+        self._dashboard.set_metrics(metrics)
         self._dashboard.set_status(status)
+        self._configure_polling(runtime, self._dashboard)
+
+        watch_files = self._extract_watch_files(runtime)
+
+        if not watch_files:
+            runtime.log.error("No files to watch - Supply the `-f` option or configure files to watch in `config/dev.ini`.")
+            status.close()
+            return
+
+        watcher_kind = runtime.config.get(Watch.CONFIG_SECTION_NAME, 'watcher')
+        file_watcher = watcher.create_watcher(watcher_kind)
+        self._dashboard.set_watcher(file_watcher)
+
+        config_reloader = ConfigReloader()
+        config_reloader.set_status(status)
+        config_reloader.set_watcher(file_watcher)
+        config_reloader.set_dashboard(self._dashboard)
+        config_reloader.set_log(runtime.log)
+        config_reloader.apply(watch_files)
+        state_snapshot = self._build_state_snapshot(runtime, status, history)
+
+        if runtime.config.get_boolean(Watch.CONFIG_SECTION_NAME, 'reload-config') is not False:
+            def read_watch_files():
+                runtime.config.read()
+                return self._extract_watch_files(runtime)
+            config_reloader.set_read_watch_files(read_watch_files)
+            config_reloader.set_config_filenames(runtime.config.config_filenames)
+            # Wake on edits to the config as we would for a watched file.
+            for config_filename in runtime.config.config_filenames:
+                file_watcher.add_filename(config_filename)
+            self._dashboard.set_config_reloader(config_reloader)
+
+        try:
+            if runtime.options.log_level == Log.LEVEL_DEBUG:
+                runtime.log.debug(json.dumps(watch_files, indent=2),
+                                  prefix="WATCH_FILES")
+                statuses = status.get_statuses()
+                runtime.log.debug(json.dumps(self._statuses_to_dicts(statuses), indent=2),
+                                  prefix="STATUS")
+            else:
+                self._dashboard.run()
+        finally:
+            if state_snapshot:
+                state_snapshot.save()
+            file_watcher.close()
+            status.close()
+
+    def _run_client(self, runtime):
+        """
+        Render the statuses published by a daemon, which owns the files to
+        watch and all the work of checking them.
+        """
+        remote_status = RemoteStatus(runtime.options.connect_filename)
+        remote_status.connect()
+
+        self._dashboard = CursesDashboard()
+        self._configure_curses_dashboard(runtime, self._dashboard)
+        self._configure_polling(runtime, self._dashboard)
+        self._dashboard.set_metrics(self._build_metrics(runtime))
+        self._dashboard.set_status(remote_status)
+        self._dashboard.set_watcher(RemoteWatcher(remote_status))
+        for cell in remote_status.get_cells():
+            self._dashboard.add_cell(cell['filename'], cell['label'])
+
+        try:
+            if runtime.options.log_level == Log.LEVEL_DEBUG:
+                statuses = remote_status.get_statuses()
+                runtime.log.debug(json.dumps(self._statuses_to_dicts(statuses), indent=2),
+                                  prefix="STATUS")
+            else:
+                self._dashboard.run()
+        finally:
+            remote_status.close()
+
+    def _statuses_to_dicts(self, statuses):
+        return dict((filename, status.to_dict())
+                    for filename, status in statuses.iteritems())
+
+    def _build_metrics(self, runtime):
+        metrics = Metrics()
+        metrics.set_log(runtime.log)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'metrics-summary-seconds'):
+            metrics_summary_seconds = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'metrics-summary-seconds'))
+            metrics.set_summary_period_seconds(metrics_summary_seconds)
+
+        return metrics
+
+    def _configure_polling(self, runtime, dashboard):
         if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'long-sleep-duration'):
             long_sleep_duration = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'long-sleep-duration'))
-            self._dashboard.set_long_sleep_duration(long_sleep_duration)
+            dashboard.set_long_sleep_duration(long_sleep_duration)
         if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'short-sleep-duration'):
             short_sleep_duration = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'short-sleep-duration'))
-            self._dashboard.set_short_sleep_duration(short_sleep_duration)
+            dashboard.set_short_sleep_duration(short_sleep_duration)
         if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'short-sleep-period-seconds'):
             short_sleep_period_seconds = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'short-sleep-period-seconds'))
-            self._dashboard.set_short_sleep_period_seconds(short_sleep_period_seconds)
+            dashboard.set_short_sleep_period_seconds(short_sleep_period_seconds)
+
+    def _configure_curses_dashboard(self, runtime, dashboard):
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'min-cell-width'):
+            min_cell_width = int(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'min-cell-width'))
+            dashboard.set_min_cell_width(min_cell_width)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'min-cell-height'):
+            min_cell_height = int(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'min-cell-height'))
+            dashboard.set_min_cell_height(min_cell_height)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'show-clock'):
+            show_clock = runtime.config.get_boolean(Watch.CONFIG_SECTION_NAME, 'show-clock')
+            dashboard.set_show_clock(show_clock)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'show-metrics'):
+            show_metrics = runtime.config.get_boolean(Watch.CONFIG_SECTION_NAME, 'show-metrics')
+            dashboard.set_show_metrics(show_metrics)
+
+    def _configure_history(self, runtime, status, dashboard):
+        history_size = History.DEFAULT_CAPACITY
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'history-size'):
+            history_size = int(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'history-size'))
+        if history_size <= 0:
+            return None
+
+        history = History(history_size)
+        status.set_history(history)
+        dashboard.set_history(history)
+
+        return history
+
+    def _build_state_snapshot(self, runtime, status, history):
+        """
+        Load the state saved by an earlier run, if a `state-file` is
+        configured, and have it saved again as we go.
+        """
+        state_filename = runtime.config.get(Watch.CONFIG_SECTION_NAME, 'state-file')
+        if not state_filename:
+            return None
+        if not os.path.isabs(state_filename) and runtime.config.dotfile_dirname:
+            state_filename = os.path.join(runtime.config.dotfile_dirname, state_filename)
+
+        state_snapshot = StateSnapshot()
+        state_snapshot.set_filename(state_filename)
+        state_snapshot.set_status(status)
+        state_snapshot.set_history(history)
+        state_snapshot.set_log(runtime.log)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'state-save-seconds'):
+            state_save_seconds = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'state-save-seconds'))
+            state_snapshot.set_period_seconds(state_save_seconds)
+        state_snapshot.load()
+        status.set_state_snapshot(state_snapshot)
+
+        return state_snapshot
+
+    def _configure_status(self, runtime, status):
         if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'new-age-seconds'):
             new_age_seconds = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'new-age-seconds'))
             status.set_new_age_seconds(new_age_seconds)
         if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'young-age-seconds'):
             young_age_seconds = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'young-age-seconds'))
             status.set_young_age_seconds(young_age_seconds)
-
-        watch_files = self._extract_watch_files(runtime)
-
-        if not watch_files:
-            runtime.log.error("No files to watch - Supply the `-f` option or configure files to watch in `config/dev.ini`.")
-            return
-
-        for watch_file in watch_files:
-            status.add_filename(watch_file['filename'], watch_file['success-pattern-string'])
-            self._dashboard.add_cell(watch_file['filename'], watch_file['label'])
-
-        if runtime.options.log_level == Log.LEVEL_DEBUG:
-            runtime.log.debug(json.dumps(watch_files, indent=2),
-                              prefix="WATCH_FILES")
-            statuses = status.get_statuses()
-            runtime.log.debug(json.dumps(statuses, indent=2),
-                              prefix="STATUS")
-        else:
-            self._dashboard.run()
-
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'quiet-period-seconds'):
+            quiet_period_seconds = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'quiet-period-seconds'))
+            status.set_quiet_period_seconds(quiet_period_seconds)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'success-cache-size'):
+            success_cache_size = int(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'success-cache-size'))
+            status.set_success_cache_size(success_cache_size)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'worker-count'):
+            worker_count = int(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'worker-count'))
+            status.set_worker_count(worker_count)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'tick-deadline-seconds'):
+            tick_deadline_seconds = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'tick-deadline-seconds'))
+            status.set_tick_deadline_seconds(tick_deadline_seconds)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'min-poll-seconds'):
+            min_poll_seconds = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'min-poll-seconds'))
+            status.set_min_poll_seconds(min_poll_seconds)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'max-poll-seconds'):
+            max_poll_seconds = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'max-poll-seconds'))
+            status.set_max_poll_seconds(max_poll_seconds)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'poll-backoff'):
+            poll_backoff = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'poll-backoff'))
+            status.set_poll_backoff(poll_backoff)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'classifier'):
+            classifier_kind = runtime.config.get(Watch.CONFIG_SECTION_NAME, 'classifier')
+            status.set_classifier(classifier.create_classifier(classifier_kind))
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'directory-full-refresh-seconds'):
+            directory_full_refresh_seconds = float(runtime.config.get(Watch.CONFIG_SECTION_NAME, 'directory-full-refresh-seconds'))
+            status.set_directory_full_refresh_seconds(directory_full_refresh_seconds)
 
     def _extract_watch_files(self, runtime):
         filename_pattern = re.compile('^(.*)-filename$')
+        directory_pattern = re.compile('^(.*)-directory$')
         absolute_path_pattern = re.compile('^/')
 
         global_success_pattern = None
         if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'global-success-pattern'):
             global_success_pattern = runtime.config.get(Watch.CONFIG_SECTION_NAME, 'global-success-pattern')
 
+        # Several failure patterns may be given, one per continuation line.
+        global_failure_patterns = ''
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'global-failure-pattern'):
+            global_failure_patterns = runtime.config.get(Watch.CONFIG_SECTION_NAME, 'global-failure-pattern')
+
         filename_prefix = None
         if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'filename-prefix'):
             filename_prefix = runtime.config.get(Watch.CONFIG_SECTION_NAME, 'filename-prefix')
         elif runtime.config.dotfile_dirname:
             filename_prefix = runtime.config.dotfile_dirname
 
+        global_scan_mode = None
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'global-scan-mode'):
+            global_scan_mode = runtime.config.get(Watch.CONFIG_SECTION_NAME, 'global-scan-mode')
+
+        global_success_anchor = None
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'global-success-anchor'):
+            global_success_anchor = runtime.config.get(Watch.CONFIG_SECTION_NAME, 'global-success-anchor')
+
+        global_detect_mode = None
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, 'global-detect'):
+            global_detect_mode = runtime.config.get(Watch.CONFIG_SECTION_NAME, 'global-detect')
+
         watch_files = []
         for key, value in runtime.config.each_in_section(Watch.CONFIG_SECTION_NAME):
-            match = filename_pattern.match(key)
+            match = filename_pattern.match(key) or directory_pattern.match(key)
             if match:
                 label = match.group(1)
-                filename = value
-                success_pattern_string = None
-                success_pattern_key = '%s-success-pattern' % label
-                if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, success_pattern_key):
-                    success_pattern_string = runtime.config.get(Watch.CONFIG_SECTION_NAME, success_pattern_key)
-
-                watch_files.append({
+                watch_file = {
                     'label': label,
-                    'filename': filename,
-                    'success-pattern-string': success_pattern_string
-                })
+                    'filename': value,
+                    'is-directory': match.re is directory_pattern,
+                    'success-pattern-string': self._get_label_option(runtime, label, 'success-pattern',
+                                                                     global_success_pattern),
+                    'failure-pattern-strings': self._split_lines(
+                        self._get_label_option(runtime, label, 'failure-pattern', global_failure_patterns)),
+                    'scan-mode': self._get_label_option(runtime, label, 'scan-mode', global_scan_mode),
+                    'success-anchor': self._get_label_option(runtime, label, 'success-anchor',
+                                                             global_success_anchor),
+                    'tail-limit-bytes': None,
+                    'detect-mode': self._get_label_option(runtime, label, 'detect', global_detect_mode)
+                }
+                tail_limit_bytes = self._get_label_option(runtime, label, 'tail-limit-bytes')
+                if tail_limit_bytes:
+                    watch_file['tail-limit-bytes'] = int(tail_limit_bytes)
+                if watch_file['is-directory']:
+                    include_patterns = self._get_label_option(runtime, label, 'include', '')
+                    exclude_patterns = self._get_label_option(runtime, label, 'exclude', '')
+                    watch_file['include-patterns'] = include_patterns.split()
+                    watch_file['exclude-patterns'] = exclude_patterns.split()
+
+                watch_files.append(watch_file)
 
         if runtime.options.filenames:
             for filename in runtime.options.filenames:
                 watch_files.append({
                     'label': filename,
                     'filename': filename,
-                    'success-pattern-string': runtime.options.success_pattern_string
+                    'is-directory': False,
+                    'success-pattern-string': runtime.options.success_pattern_string or global_success_pattern,
+                    'failure-pattern-strings': (runtime.options.failure_pattern_strings or
+                                                self._split_lines(global_failure_patterns)),
+                    'scan-mode': global_scan_mode,
+                    'success-anchor': global_success_anchor,
+                    'tail-limit-bytes': None,
+                    'detect-mode': global_detect_mode
                 })
 
         if filename_prefix:
@@ -125,3 +375,13 @@ class Watch:
                     watch_file['filename'] = os.path.join(filename_prefix, watch_file['filename'])
 
         return watch_files
+
+    def _split_lines(self, value):
+        return [line.strip() for line in value.splitlines() if line.strip()]
+
+    def _get_label_option(self, runtime, label, name, default=None):
+        key = '%s-%s' % (label, name)
+        if runtime.config.has_option(Watch.CONFIG_SECTION_NAME, key):
+            return runtime.config.get(Watch.CONFIG_SECTION_NAME, key)
+
+        return default
@@ -0,0 +1,207 @@
+import collections
+import os
+
+import cache
+
+
+class ConfigReloader(object):
+    """
+    Class to keep a running Status, watcher and dashboard in step with the
+    files listed in the config, without a restart.
+
+    When a config file changes on disk we read the watch files again and
+    apply only the difference: entries which were removed or changed are
+    dropped, and new or changed ones added. Files whose entries are
+    checked as they were keep everything known of them, such as their
+    cached scan results, even if their cells were relabelled.
+    Options other than the watch files are only read at startup.
+    """
+
+    def __init__(self):
+        self._read_watch_files = None
+        self._config_filenames = []
+        self._fingerprints = None
+        self._watch_files = collections.OrderedDict()
+        self._files = collections.OrderedDict()
+        self._status = None
+        self._watcher = None
+        self._dashboard = None
+        self._log = None
+
+    def set_read_watch_files(self, read_watch_files):
+        """
+        Reread the config and extract its watch files with the callable
+        @read_watch_files.
+        """
+        self._read_watch_files = read_watch_files
+
+    def set_config_filenames(self, config_filenames):
+        self._config_filenames = list(config_filenames)
+        self._fingerprints = self._fingerprint_config()
+
+    def set_status(self, status):
+        self._status = status
+
+    def set_watcher(self, watcher):
+        self._watcher = watcher
+
+    def set_dashboard(self, dashboard):
+        self._dashboard = dashboard
+
+    def set_log(self, log):
+        self._log = log
+
+    def check(self):
+        """
+        Reload the watch files if a config file changed since we last
+        looked, returning whether they were reloaded. A config which can't
+        be read, such as one caught halfway through being saved, or which
+        has bad options, such as a pattern which doesn't compile, leaves
+        the current watch files in place.
+
+        We only log at the verbose level, since by default the log shares
+        the terminal with the dashboard.
+        """
+        fingerprints = self._fingerprint_config()
+        if fingerprints == self._fingerprints:
+            return False
+        self._fingerprints = fingerprints
+
+        try:
+            watch_files = self._read_watch_files()
+            if not watch_files:
+                # As at startup; most likely caught halfway through being saved.
+                raise Exception('no files to watch')
+            (added, removed) = self.apply(watch_files)
+        except Exception as exception:
+            if self._log:
+                self._log.verbose('not reloading the config: %s', exception)
+            return False
+
+        if self._log and (added or removed):
+            self._log.verbose('reloaded the config: %d added, %d removed', added, removed)
+
+        return True
+
+    def apply(self, watch_files):
+        """
+        Bring the status, watcher and dashboard from the watch files we
+        last applied to @watch_files, returning how many entries were
+        added and how many removed. A changed entry counts as both.
+
+        Entries are told apart by label and filename, so that a file may
+        have a cell under each of several labels. It's only checked once,
+        in the way its first entry says.
+
+        Every new entry is checked before anything is removed, so that bad
+        options raise with the watch files we last applied still in place.
+        """
+        entries = collections.OrderedDict()
+        files = collections.OrderedDict()
+        for watch_file in watch_files:
+            key = (watch_file['label'], watch_file['filename'])
+            if key in entries:
+                self._log_duplicate('%s is listed twice under %s; showing it once',
+                                    watch_file['filename'], watch_file['label'])
+                continue
+            entries[key] = watch_file
+            first_watch_file = files.setdefault(watch_file['filename'], watch_file)
+            if self._get_check_options(first_watch_file) != self._get_check_options(watch_file):
+                self._log_duplicate('%s is checked as %s says, not %s',
+                                    watch_file['filename'], first_watch_file['label'],
+                                    watch_file['label'])
+
+        removed_files = [watch_file for filename, watch_file in self._files.iteritems()
+                         if not self._is_same_check(files.get(filename), watch_file)]
+        added_files = [watch_file for filename, watch_file in files.iteritems()
+                       if not self._is_same_check(self._files.get(filename), watch_file)]
+        for watch_file in added_files:
+            self._status.compile_options(watch_file['filename'],
+                                         watch_file['success-pattern-string'],
+                                         watch_file['scan-mode'],
+                                         watch_file['failure-pattern-strings'],
+                                         watch_file['success-anchor'],
+                                         watch_file['detect-mode'])
+
+        removed = 0
+        for key, watch_file in self._watch_files.iteritems():
+            if entries.get(key) != watch_file:
+                removed += 1
+            if key not in entries:
+                self._dashboard.remove_cell(watch_file['filename'], watch_file['label'])
+        for watch_file in removed_files:
+            self._remove(watch_file)
+        for watch_file in added_files:
+            self._add(watch_file)
+        added = 0
+        for key, watch_file in entries.iteritems():
+            if self._watch_files.get(key) != watch_file:
+                added += 1
+            if key not in self._watch_files:
+                self._dashboard.add_cell(watch_file['filename'], watch_file['label'])
+        self._watch_files = entries
+        self._files = files
+
+        return (added, removed)
+
+    def _get_check_options(self, watch_file):
+        """
+        Return the options of @watch_file which say how its file is
+        checked, as opposed to how it's shown.
+        """
+        options = dict(watch_file)
+        del options['label']
+
+        return options
+
+    def _is_same_check(self, watch_file, other_watch_file):
+        return (watch_file is not None and
+                self._get_check_options(watch_file) == self._get_check_options(other_watch_file))
+
+    def _log_duplicate(self, message, *args):
+        # Say so on the terminal at startup; after that, the dashboard has it.
+        if not self._log:
+            return
+        if self._watch_files:
+            self._log.verbose(message, *args)
+        else:
+            self._log.warning(message, *args)
+
+    def _add(self, watch_file):
+        if watch_file['is-directory']:
+            self._status.add_directory(watch_file['filename'],
+                                       watch_file['success-pattern-string'],
+                                       watch_file['scan-mode'],
+                                       watch_file['include-patterns'],
+                                       watch_file['exclude-patterns'],
+                                       watch_file['failure-pattern-strings'],
+                                       watch_file['success-anchor'],
+                                       watch_file['tail-limit-bytes'],
+                                       watch_file['detect-mode'])
+            self._watcher.add_directory(watch_file['filename'])
+        else:
+            self._status.add_filename(watch_file['filename'],
+                                      watch_file['success-pattern-string'],
+                                      watch_file['scan-mode'],
+                                      watch_file['failure-pattern-strings'],
+                                      watch_file['success-anchor'],
+                                      watch_file['tail-limit-bytes'],
+                                      watch_file['detect-mode'])
+            self._watcher.add_filename(watch_file['filename'])
+
+    def _remove(self, watch_file):
+        if watch_file['is-directory']:
+            self._watcher.remove_directory(watch_file['filename'])
+        else:
+            self._watcher.remove_filename(watch_file['filename'])
+        self._status.remove_filename(watch_file['filename'])
+
+    def _fingerprint_config(self):
+        fingerprints = []
+        for filename in self._config_filenames:
+            try:
+                fingerprints.append(cache.fingerprint(os.stat(filename)))
+            except OSError:
+                fingerprints.append(None)
+
+        return fingerprints
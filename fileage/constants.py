@@ -3,11 +3,46 @@ class Namespace:
     def __init__(self, **kwargs):
         self.__dict__.update(kwargs)
 
+# Small integers, which double as the dashboard's color pair numbers.
 States = Namespace(
-    NO_INFO='no_info',
-    NEW='new',
-    YOUNG='young',
-    OLD='old',
-    ERROR='error'
+    NO_INFO=1,
+    NEW=2,
+    YOUNG=3,
+    OLD=4,
+    ERROR=5,
+    WRITING=6
 )
 
+# The names states go by in JSON.
+STATE_NAMES = {
+    States.NO_INFO: 'no_info',
+    States.NEW: 'new',
+    States.YOUNG: 'young',
+    States.OLD: 'old',
+    States.ERROR: 'error',
+    States.WRITING: 'writing'
+}
+STATE_CODES = dict((name, code) for code, name in STATE_NAMES.iteritems())
+
+ScanModes = Namespace(
+    FULL='full',
+    INCREMENTAL='incremental'
+)
+
+# Where in a file a full scan starts looking for its success pattern.
+SuccessAnchors = Namespace(
+    HEAD='head',
+    TAIL='tail'
+)
+
+# How a file is judged to have changed.
+DetectModes = Namespace(
+    MTIME='mtime',
+    CONTENT='content'
+)
+
+
+MessageTypes = Namespace(
+    SNAPSHOT='snapshot',
+    DIFF='diff'
+)
@@ -1,76 +1,126 @@
 #!/usr/bin/env python
 
+import fcntl
 import signal
+import struct
 import sys
 import curses
 import math
+import termios
+from curses import ascii
 from curses import textpad
 import time
 import datetime
 
 import constants
+from frontend import Frontend
+from watcher import PollingWatcher
 
-class CursesDashboard(object):
-    NO_INFO_COLOR = 1
-    NEW_COLOR = 2
-    YOUNG_COLOR = 3
-    OLD_COLOR = 4
-    ERROR_COLOR = 5
+class CursesDashboard(Frontend):
+    # Each state is drawn in the color pair of the same number.
+    NO_INFO_COLOR = constants.States.NO_INFO
+    NEW_COLOR = constants.States.NEW
+    YOUNG_COLOR = constants.States.YOUNG
+    OLD_COLOR = constants.States.OLD
+    ERROR_COLOR = constants.States.ERROR
+    WRITING_COLOR = constants.States.WRITING
+
+    ESCAPE_KEY = 27
 
     def __init__(self):
+        super(CursesDashboard, self).__init__()
         self._stdscr = None
         self._is_signal_handler_installed = False
-        self._cells = []
-        self._status = None
-
-        self._long_sleep_duration = 0.7
-        self._short_sleep_duration = 0.3
-        self._short_sleep_period_seconds = 3
-
-    def add_cell(self, filename, label=None):
-        cell = {
-            'filename': filename,
-            'label': label or filename,
-            'window': None
-        }
-        self._cells.append(cell)
-
-    def set_status(self, status):
-        self._status = status
-
-    def set_long_sleep_duration(self, long_sleep_duration):
-        self._long_sleep_duration = long_sleep_duration
-
-    def set_short_sleep_duration(self, short_sleep_duration):
-        self._short_sleep_duration = short_sleep_duration
-
-    def set_short_sleep_period_seconds(self, short_sleep_period_seconds):
-        self._short_sleep_period_seconds = short_sleep_period_seconds
+        self._show_clock = True
+        self._clock_text = None
+        self._is_resize_pending = False
+        self._is_layout_pending = False
+        self._history = None
+        self._is_paused = False
+        self._filter_text = ''
+        self._is_filter_editing = False
+
+        self._min_cell_width = 20
+        self._min_cell_height = 1
+        self._columns = 1
+        self._visible_rows = 1
+        self._scroll_row = 0
+        self._slot_windows = []
+        self._visible_cells = []
+        self._shown_cells = []
+        self._footer_window = None
+        self._is_footer_dirty = False
+        self._show_metrics = False
+        self._metrics_window = None
+
+    def set_history(self, history):
+        """
+        Draw sparklines of each file's recent rebuilds from @history,
+        in cells tall enough for them.
+        """
+        self._history = history
+
+    def set_show_clock(self, show_clock):
+        self._show_clock = show_clock
+
+    def set_show_metrics(self, show_metrics):
+        """
+        Start with the timings overlay showing; `m` toggles it either way.
+        """
+        self._show_metrics = show_metrics
+
+    def set_min_cell_width(self, min_cell_width):
+        self._min_cell_width = min_cell_width
+
+    def set_min_cell_height(self, min_cell_height):
+        self._min_cell_height = min_cell_height
 
     def run(self):
         assert self._status, "no status helper object set."
+        if not self._watcher:
+            self._watcher = PollingWatcher()
 
         try:
             self._setup()
             self._install_signal_handler()
 
-            sleep_duration = self._short_sleep_duration
-            time_last_changed = datetime.datetime.now()
+            time_last_changed = time.time()
+            # Keys, and checks finishing on workers, wake us as well as changes.
+            # While paused, finished checks are left until we resume, since
+            # we wouldn't collect them and their pipe would stay readable.
+            status_wake_files = self._get_wake_files()
 
             while True:
                 if not self._stdscr:
                     break
-                any_changes = self._update_status()
-                now = datetime.datetime.now()
+                any_changes = False
+                if not self._is_paused:
+                    self._refresh_cells()
+                    tick_start_time = time.time()
+                    any_changes = self._update_statuses()
+                now = time.time()
                 if any_changes:
                     time_last_changed = now
-                time_since_changed = now - time_last_changed
-                if time_since_changed.seconds > self._short_sleep_period_seconds:
-                    sleep_duration = self._long_sleep_duration
-                else:
-                    sleep_duration = self._short_sleep_duration
                 self._redraw()
-                time.sleep(sleep_duration)
+                if self._metrics and not self._is_paused:
+                    self._metrics.record('status-seconds', now - tick_start_time)
+                    self._metrics.record('redraw-seconds', time.time() - now)
+                    self._metrics.log_summary_if_due(now)
+
+                timeout = self._compute_wait_timeout(now, time_last_changed)
+                wait_start_time = time.time()
+                wake_files = [sys.stdin]
+                if not self._is_paused:
+                    wake_files.extend(status_wake_files)
+                changed_filenames = self._watcher.wait(timeout, wake_files)
+                if self._is_paused:
+                    # Hold on to what changed until we resume.
+                    changed_filenames = set(changed_filenames or ()) | set(self._changed_filenames or ())
+                self._changed_filenames = changed_filenames
+                slept = time.time() - wait_start_time
+                if self._metrics and timeout is not None and slept >= timeout:
+                    self._metrics.record('sleep-overshoot-seconds', slept - timeout)
+                self._handle_input()
         except Exception as exception:
             exc_info = sys.exc_info()
             self._teardown()
@@ -78,6 +128,30 @@ class CursesDashboard(object):
 
         self._teardown()
 
+    def _compute_wait_timeout(self, now, time_last_changed):
+        """
+        Also wake when the clock ticks over. While paused, only the clock
+        and keys wake us.
+        """
+        clock_deadlines = [math.floor(now) + 1] if self._show_clock else []
+        if self._is_paused:
+            if not clock_deadlines:
+                return None
+            return clock_deadlines[0] - now + CursesDashboard.DEADLINE_SLACK_SECONDS
+
+        return super(CursesDashboard, self)._compute_wait_timeout(now, time_last_changed,
+                                                                  clock_deadlines)
+
+    def _on_cell_added(self, cell):
+        cell['window'] = None
+        if self._stdscr:
+            self._reset_cell(cell)
+            self._is_layout_pending = True
+
+    def _on_cell_removed(self, filename):
+        if self._stdscr:
+            self._is_layout_pending = True
+
     def _setup(self):
         self._setup_curses()
         self._setup_colors()
@@ -86,6 +160,7 @@ class CursesDashboard(object):
     def _setup_curses(self):
         self._stdscr = curses.initscr()
         self._stdscr.keypad(1)
+        self._stdscr.nodelay(1)
         curses.start_color()
         curses.noecho()
         curses.cbreak()
@@ -110,26 +185,192 @@ class CursesDashboard(object):
         curses.init_pair(CursesDashboard.YOUNG_COLOR, curses.COLOR_BLACK, curses.COLOR_YELLOW)
         curses.init_pair(CursesDashboard.OLD_COLOR, curses.COLOR_BLACK, curses.COLOR_WHITE)
         curses.init_pair(CursesDashboard.ERROR_COLOR, curses.COLOR_BLACK, curses.COLOR_RED)
+        curses.init_pair(CursesDashboard.WRITING_COLOR, curses.COLOR_BLACK, curses.COLOR_CYAN)
 
     def _setup_cell_windows(self):
-        min_cell_width = 20
-        cell_count = len(self._cells)
-
+        for cell in self._cells:
+            self._reset_cell(cell)
+        self._layout_cells()
+
+    def _reset_cell(self, cell):
+        cell['state'] = CursesDashboard.NO_INFO_COLOR
+        cell['is-stale'] = False
+        cell['failure-line'] = None
+        cell['history-count'] = 0
+        cell['is-dirty'] = True
+
+    def _layout_cells(self):
+        """
+        Arrange the cells in as few columns as lets every row be at least
+        `min_cell_height` tall, paging when even the narrowest columns
+        can't fit them all. Windows belong to the visible slots rather
+        than to cells, so we only ever hold a screenful of them. Only cells
+        whose label matches the filter, if any, are laid out.
+        """
+        filter_text = self._filter_text.lower()
+        self._shown_cells = [cell for cell in self._cells
+                             if filter_text in cell['label'].lower()]
+        cell_count = len(self._shown_cells)
         (total_height, total_width) = self._stdscr.getmaxyx()
 
-        cells_per_row = 1
-        cells_per_col = math.ceil(cell_count / cells_per_row) or 1
-
-        cell_height = int(math.floor(total_height / cells_per_col))
-        cell_width = int(math.floor(total_width / cells_per_row))
-        for index, cell in enumerate(self._cells):
-            cell['height'] = cell_height
-            cell['width'] = cell_width
-            cell['row'] = int(math.floor(index / cells_per_row) * cell_height)
-            cell['col'] = (index % cells_per_row) * cell_width
-            cell['state'] = CursesDashboard.NO_INFO_COLOR
-            win = self._stdscr.subwin(cell['height'], cell['width'], cell['row'], cell['col'])
+        grid_height = total_height
+        has_metrics_line = self._metrics and self._show_metrics and grid_height > 1
+        if has_metrics_line:
+            grid_height -= 1
+
+        max_columns = max(1, total_width // self._min_cell_width)
+        rows_that_fit = max(1, grid_height // self._min_cell_height)
+        columns = int(math.ceil(float(cell_count) / rows_that_fit)) or 1
+        columns = min(columns, max_columns)
+        row_count = int(math.ceil(float(cell_count) / columns)) or 1
+
+        is_paged = row_count > rows_that_fit
+        has_footer = (is_paged or self._is_paused or self._is_filter_editing or
+                      self._filter_text) and grid_height > 1
+        if has_footer:
+            grid_height -= 1
+        visible_rows = min(row_count, max(1, grid_height // self._min_cell_height))
+
+        self._columns = columns
+        self._visible_rows = visible_rows
+        self._scroll_row = max(0, min(self._scroll_row, row_count - visible_rows))
+
+        cell_height = max(1, grid_height // visible_rows)
+        cell_width = max(1, total_width // columns)
+        slot_count = columns * visible_rows
+        for slot in range(slot_count):
+            row = (slot // columns) * cell_height
+            col = (slot % columns) * cell_width
+            height = cell_height
+            width = cell_width
+            # The last row and column soak up any remainder.
+            if slot // columns == visible_rows - 1:
+                height = grid_height - row
+            if slot % columns == columns - 1:
+                width = total_width - col
+            self._place_slot_window(slot, height, width, row, col)
+        del self._slot_windows[slot_count:]
+
+        self._footer_window = None
+        if has_footer:
+            self._footer_window = curses.newwin(1, total_width, grid_height, 0)
+        self._metrics_window = None
+        if has_metrics_line:
+            self._metrics_window = curses.newwin(1, total_width, total_height - 1, 0)
+
+        self._assign_visible_cells()
+
+    def _place_slot_window(self, slot, height, width, row, col):
+        if slot < len(self._slot_windows):
+            win = self._slot_windows[slot]
+            try:
+                win.resize(height, width)
+                win.mvwin(row, col)
+                return
+            except curses.error:
+                self._slot_windows[slot] = curses.newwin(height, width, row, col)
+        else:
+            self._slot_windows.append(curses.newwin(height, width, row, col))
+
+    def _assign_visible_cells(self):
+        for cell in self._visible_cells:
+            cell['window'] = None
+
+        first = self._scroll_row * self._columns
+        self._visible_cells = self._shown_cells[first:first + len(self._slot_windows)]
+        for cell, win in zip(self._visible_cells, self._slot_windows):
             cell['window'] = win
+            cell['is-dirty'] = True
+        for win in self._slot_windows[len(self._visible_cells):]:
+            win.erase()
+            win.noutrefresh()
+        self._clock_text = None
+        self._is_footer_dirty = True
+
+    def _scroll(self, rows):
+        row_count = int(math.ceil(float(len(self._shown_cells)) / self._columns))
+        scroll_row = max(0, min(self._scroll_row + rows, row_count - self._visible_rows))
+        if scroll_row == self._scroll_row:
+            return
+        self._scroll_row = scroll_row
+        self._assign_visible_cells()
+
+    def _handle_input(self):
+        while self._stdscr:
+            key = self._stdscr.getch()
+            if key == -1:
+                break
+            elif self._is_filter_editing:
+                self._edit_filter(key)
+            elif key in (curses.KEY_NPAGE, ord(' ')):
+                self._scroll(self._visible_rows)
+            elif key == curses.KEY_PPAGE:
+                self._scroll(-self._visible_rows)
+            elif key in (curses.KEY_DOWN, ord('j')):
+                self._scroll(1)
+            elif key in (curses.KEY_UP, ord('k')):
+                self._scroll(-1)
+            elif key in (curses.KEY_HOME, ord('g')):
+                self._scroll(-len(self._cells))
+            elif key in (curses.KEY_END, ord('G')):
+                self._scroll(len(self._cells))
+            elif ord('1') <= key <= ord('9'):
+                self._scroll((key - ord('1')) * self._visible_rows - self._scroll_row)
+            elif key == ord('p'):
+                self._is_paused = not self._is_paused
+                self._is_layout_pending = True
+            elif key == ord('r'):
+                if hasattr(self._status, 'rescan'):
+                    self._status.rescan()
+            elif key == ord('/'):
+                self._is_filter_editing = True
+                self._is_layout_pending = True
+            elif key == CursesDashboard.ESCAPE_KEY and self._filter_text:
+                self._edit_filter(key)
+            elif key == ord('m'):
+                # Lay out again to make room for the overlay or give it back.
+                self._show_metrics = not self._show_metrics
+                self._is_resize_pending = True
+            elif key == curses.KEY_RESIZE:
+                self._is_resize_pending = True
+
+        if self._is_resize_pending and self._stdscr:
+            self._is_resize_pending = False
+            self._resize()
+
+    def _edit_filter(self, key):
+        """
+        Apply one key typed into the filter, narrowing the cells shown as
+        it goes. Enter keeps the filter and Escape clears it.
+        """
+        if key in (curses.KEY_ENTER, ord('\n'), ord('\r')):
+            self._is_filter_editing = False
+        elif key == CursesDashboard.ESCAPE_KEY:
+            self._is_filter_editing = False
+            self._filter_text = ''
+        elif key in (curses.KEY_BACKSPACE, ascii.DEL, ascii.BS):
+            self._filter_text = self._filter_text[:-1]
+        elif ascii.isprint(key):
+            self._filter_text += chr(key)
+        else:
+            return
+        self._scroll_row = 0
+        self._is_layout_pending = True
+
+    def _resize(self):
+        """
+        Adopt the terminal's new size, moving and resizing the existing
+        slot windows rather than building new ones.
+        """
+        try:
+            packed_size = fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ, '\0' * 8)
+            (height, width) = struct.unpack('hhhh', packed_size)[:2]
+            curses.resizeterm(height, width)
+        except (IOError, curses.error):
+            pass
+        self._stdscr.erase()
+        self._stdscr.noutrefresh()
+        self._layout_cells()
 
     def _install_signal_handler(self):
         if self._is_signal_handler_installed:
@@ -138,50 +379,163 @@ class CursesDashboard(object):
         def signal_handler(signal, frame):
             self._teardown()
         signal.signal(signal.SIGINT, signal_handler)
+
+        def resize_handler(signal, frame):
+            self._is_resize_pending = True
+        signal.signal(signal.SIGWINCH, resize_handler)
         self._is_signal_handler_installed = True
 
-    def _update_status(self):
-        statuses = self._status.get_statuses()
+    def _update_statuses(self):
+        statuses = self._status.get_statuses(self._changed_filenames,
+                                             self._watcher.get_closed_filenames())
         any_changes = False
+        self._any_stale = False
         for cell in self._cells:
             filename = cell['filename']
             state = CursesDashboard.NO_INFO_COLOR
-            if filename in statuses:
-                status = statuses[filename]
-                if status['state'] == constants.States.NO_INFO:
-                    state = CursesDashboard.NO_INFO_COLOR
-                elif status['state'] == constants.States.NEW:
-                    state = CursesDashboard.NEW_COLOR
-                elif status['state'] == constants.States.YOUNG:
-                    state = CursesDashboard.YOUNG_COLOR
-                elif status['state'] == constants.States.OLD:
-                    state = CursesDashboard.OLD_COLOR
-                elif status['state'] == constants.States.ERROR:
-                    state = CursesDashboard.ERROR_COLOR
-
-            if cell['state'] != state:
+            is_stale = False
+            failure_line = None
+            status = statuses.get(filename)
+            if status:
+                state = status.state
+                is_stale = status.is_stale
+                failure_line = status.failure_line
+                self._follow_status(filename, status)
+
+            if (cell['state'] != state or cell['is-stale'] != is_stale or
+                    cell['failure-line'] != failure_line):
                 any_changes = True
+                cell['is-dirty'] = True
+            if self._history:
+                history_count = self._history.get_change_count(filename)
+                if cell['history-count'] != history_count:
+                    cell['history-count'] = history_count
+                    cell['is-dirty'] = True
 
             cell['state'] = state
+            cell['is-stale'] = is_stale
+            cell['failure-line'] = failure_line
 
         return any_changes
 
     def _redraw(self):
+        """
+        Repaint only the visible cells whose state changed, plus the clock
+        when its second ticks over, then send everything to the terminal
+        at once.
+        """
+        if self._is_layout_pending:
+            # Cells came or went, so start from a clean screen.
+            self._is_layout_pending = False
+            self._stdscr.erase()
+            self._stdscr.noutrefresh()
+            self._layout_cells()
+
         if len(self._cells) == 0:
             self._stdscr.addstr(0, 0, "No cells added to dashboard... nothing to display.", 0)
-
-        for index, cell in enumerate(self._cells):
-            linenum = 0
-            cell['window'].addstr(linenum, 0, cell['label'], cell['state'])
+            self._stdscr.noutrefresh()
+        elif len(self._shown_cells) == 0:
+            self._stdscr.addstr(0, 0, 'No labels match "%s".' % self._filter_text, 0)
+            self._stdscr.noutrefresh()
+
+        for cell in self._visible_cells:
+            if not cell['is-dirty']:
+                continue
+            self._draw_cell(cell)
+            cell['is-dirty'] = False
+
+        self._draw_clock()
+        self._draw_footer()
+        self._draw_metrics()
+        curses.doupdate()
+
+    def _draw_cell(self, cell):
+        win = cell['window']
+        win.erase()
+        linenum = 0
+        label = cell['label']
+        if cell['is-stale']:
+            label = '%s (stale)' % label
+        self._draw_line(win, linenum, label, cell['state'])
+        linenum += 1
+        if cell['label'] != cell['filename']:
+            self._draw_line(win, linenum, cell['filename'], cell['state'])
+            linenum += 1
+        if cell['failure-line']:
+            self._draw_line(win, linenum, cell['failure-line'], cell['state'])
             linenum += 1
-            if cell['label'] != cell['filename']:
-                cell['window'].addstr(linenum, 0, cell['filename'], cell['state'])
+        if self._history:
+            (height, width) = win.getmaxyx()
+            for line in self._history.format_sparklines(cell['filename'], width):
+                self._draw_line(win, linenum, line, cell['state'])
                 linenum += 1
-            if index == 0:
-                now = datetime.datetime.now()
-                cell['window'].addstr(linenum, 0, now.isoformat(), cell['state'])
-            self._fill_cell(cell)
-            cell['window'].refresh()
+        cell['clock-linenum'] = linenum
+        if cell is self._visible_cells[0]:
+            self._clock_text = None
+        self._fill_cell(cell)
+        win.noutrefresh()
+
+    def _draw_line(self, win, linenum, text, attr):
+        """
+        Write one line of @text, clipped to the window rather than wrapping
+        or raising when the cell is too small for it.
+        """
+        (height, width) = win.getmaxyx()
+        if linenum >= height:
+            return
+        try:
+            win.addstr(linenum, 0, text[:width], attr)
+        except curses.error:
+            # Writing the bottom right corner moves the cursor off the window.
+            pass
+
+    def _draw_clock(self):
+        if len(self._visible_cells) == 0:
+            return
+
+        if not self._show_clock:
+            return
+
+        now = datetime.datetime.now().replace(microsecond=0)
+        clock_text = now.isoformat()
+        if clock_text == self._clock_text:
+            return
+
+        cell = self._visible_cells[0]
+        self._draw_line(cell['window'], cell['clock-linenum'], clock_text, cell['state'])
+        cell['window'].noutrefresh()
+        self._clock_text = clock_text
+
+    def _draw_footer(self):
+        if not self._footer_window or not self._is_footer_dirty:
+            return
+
+        first = self._scroll_row * self._columns
+        parts = []
+        if self._is_paused:
+            parts.append('PAUSED (p to resume)')
+        if self._is_filter_editing:
+            parts.append('Filter: %s_' % self._filter_text)
+        elif self._filter_text:
+            parts.append('Filter: %s (/ to change)' % self._filter_text)
+        if self._visible_cells:
+            parts.append('Files %d-%d of %d' % (first + 1, first + len(self._visible_cells),
+                                                len(self._shown_cells)))
+        if len(self._visible_cells) < len(self._shown_cells):
+            parts.append('(PgUp/PgDn, Up/Down to scroll)')
+        footer_text = '  '.join(parts)
+        self._footer_window.erase()
+        self._draw_line(self._footer_window, 0, footer_text, 0)
+        self._footer_window.noutrefresh()
+        self._is_footer_dirty = False
+
+    def _draw_metrics(self):
+        if not self._metrics_window:
+            return
+
+        self._metrics_window.erase()
+        self._draw_line(self._metrics_window, 0, self._metrics.format_overlay(), curses.A_REVERSE)
+        self._metrics_window.noutrefresh()
 
     def _fill_cell(self, cell):
         win = cell['window']
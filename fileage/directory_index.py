@@ -0,0 +1,149 @@
+import fnmatch
+import os
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+class DirectoryIndex(object):
+    """
+    Class to find the newest matching file below a directory.
+
+    Listing a directory is only repeated when its modified time changes,
+    which happens when entries are created, removed or renamed within it.
+    Otherwise we only stat the matching files we already know of, to
+    catch files rewritten in place. Since a directory's modified time may
+    be too coarse to show two changes in the same second, every
+    `full_refresh_seconds` we list the whole tree again regardless.
+    """
+    DEFAULT_FULL_REFRESH_SECONDS = 30
+
+    def __init__(self, root, include_patterns=None, exclude_patterns=None):
+        self._root = root
+        self._include_patterns = include_patterns or []
+        self._exclude_patterns = exclude_patterns or []
+        self._full_refresh_seconds = DirectoryIndex.DEFAULT_FULL_REFRESH_SECONDS
+        self._time_last_full_refresh = None
+        self._directories = {}
+
+    def set_full_refresh_seconds(self, full_refresh_seconds):
+        self._full_refresh_seconds = full_refresh_seconds
+
+    def refresh(self):
+        """
+        Bring the index up to date, returning the path and stat of the
+        newest matching file, or (None, None) if there are none.
+        """
+        now = time.time()
+        is_full_refresh = (self._time_last_full_refresh is None or
+                           now - self._time_last_full_refresh >= self._full_refresh_seconds)
+        if is_full_refresh:
+            self._time_last_full_refresh = now
+
+        newest = (None, None)
+        directories = {}
+        pending = [(self._root, '')]
+        while pending:
+            (path, relative_path) = pending.pop()
+            try:
+                modified_time = os.stat(path).st_mtime
+            except OSError:
+                continue
+
+            listing = self._directories.get(path)
+            if is_full_refresh or not listing or listing['modified-time'] != modified_time:
+                (listing, file_stats) = self._list_directory(path, relative_path, modified_time)
+            else:
+                file_stats = DirectoryIndex._stat_files(listing['filenames'])
+            directories[path] = listing
+            pending.extend(listing['subdirectories'])
+
+            for (filename, stat) in file_stats:
+                if not newest[1] or stat.st_mtime > newest[1].st_mtime:
+                    newest = (filename, stat)
+
+        self._directories = directories
+
+        return newest
+
+    def _list_directory(self, path, relative_path, modified_time):
+        listing = {
+            'modified-time': modified_time,
+            'subdirectories': [],
+            'filenames': []
+        }
+        file_stats = []
+
+        for (name, entry_path, is_directory, stat) in self._each_entry(path):
+            entry_relative_path = os.path.join(relative_path, name)
+            if DirectoryIndex._matches_any(entry_relative_path, self._exclude_patterns):
+                continue
+
+            if is_directory:
+                listing['subdirectories'].append((entry_path, entry_relative_path))
+            elif (not self._include_patterns or
+                    DirectoryIndex._matches_any(entry_relative_path, self._include_patterns)):
+                listing['filenames'].append(entry_path)
+                file_stats.append((entry_path, stat))
+
+        return (listing, file_stats)
+
+    @staticmethod
+    def _stat_files(filenames):
+        file_stats = []
+        for filename in filenames:
+            try:
+                file_stats.append((filename, os.stat(filename)))
+            except OSError:
+                continue
+
+        return file_stats
+
+    def _each_entry(self, path):
+        """
+        Generate the name, path, whether it's a directory and, for regular
+        files, the stat of each entry in @path. Symlinked directories are
+        not followed, to avoid cycles.
+        """
+        if scandir:
+            try:
+                entries = list(scandir(path))
+            except OSError:
+                return
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        yield (entry.name, entry.path, True, None)
+                    elif entry.is_file():
+                        yield (entry.name, entry.path, False, entry.stat())
+                except OSError:
+                    continue
+            return
+
+        try:
+            names = os.listdir(path)
+        except OSError:
+            return
+        for name in names:
+            entry_path = os.path.join(path, name)
+            try:
+                if os.path.isdir(entry_path) and not os.path.islink(entry_path):
+                    yield (name, entry_path, True, None)
+                elif os.path.isfile(entry_path):
+                    yield (name, entry_path, False, os.stat(entry_path))
+            except OSError:
+                continue
+
+    @staticmethod
+    def _matches_any(relative_path, patterns):
+        for pattern in patterns:
+            if fnmatch.fnmatch(relative_path, pattern):
+                return True
+
+        return False
@@ -0,0 +1,178 @@
+import time
+
+from scheduler import Scheduler
+
+
+class Frontend(object):
+    """
+    Class holding what the dashboard, the JSON stream and the daemon
+    share: their cells, the helpers they're wired to, and when to wake up
+    next. Each shows or sends statuses its own way.
+
+    Subclasses may override _on_cell_added and _on_cell_removed to keep
+    their own per-cell state, and those which loop through _run_ticks
+    supply _update_statuses, and _get_wake_files and _handle_wake to be
+    woken by anything besides watched files.
+    """
+
+    # Wake this long after a deadline so that it has certainly passed.
+    DEADLINE_SLACK_SECONDS = 0.01
+
+    def __init__(self):
+        self._cells = []
+        self._status = None
+        self._watcher = None
+        self._scheduler = Scheduler()
+        self._any_stale = False
+        self._changed_filenames = None
+        self._is_running = False
+        self._metrics = None
+        self._config_reloader = None
+
+        self._long_sleep_duration = 0.7
+        self._short_sleep_duration = 0.3
+        self._short_sleep_period_seconds = 3
+
+    def add_cell(self, filename, label=None):
+        cell = {
+            'filename': filename,
+            'label': label or filename
+        }
+        self._cells.append(cell)
+        self._on_cell_added(cell)
+
+    def remove_cell(self, filename, label=None):
+        """
+        Remove the cells of @filename, or only its cell under @label.
+        """
+        self._cells = [cell for cell in self._cells
+                       if cell['filename'] != filename or label not in (None, cell['label'])]
+        self._scheduler.cancel(filename)
+        self._on_cell_removed(filename)
+
+    def set_status(self, status):
+        self._status = status
+
+    def set_watcher(self, watcher):
+        self._watcher = watcher
+
+    def set_config_reloader(self, config_reloader):
+        self._config_reloader = config_reloader
+
+    def set_metrics(self, metrics):
+        self._metrics = metrics
+
+    def set_long_sleep_duration(self, long_sleep_duration):
+        self._long_sleep_duration = long_sleep_duration
+
+    def set_short_sleep_duration(self, short_sleep_duration):
+        self._short_sleep_duration = short_sleep_duration
+
+    def set_short_sleep_period_seconds(self, short_sleep_period_seconds):
+        self._short_sleep_period_seconds = short_sleep_period_seconds
+
+    def stop(self):
+        self._is_running = False
+
+    def _on_cell_added(self, cell):
+        pass
+
+    def _on_cell_removed(self, filename):
+        pass
+
+    def _refresh_cells(self):
+        """
+        Pick up changes to our cells, from a reloaded config, or from our
+        status if it has cells of its own, as a daemon's mirror does.
+        """
+        if self._config_reloader:
+            self._config_reloader.check()
+        if hasattr(self._status, 'get_cells'):
+            self._sync_cells(self._status.get_cells())
+
+    def _sync_cells(self, cells):
+        """
+        Show @cells in place of ours, as when a daemon's cells change,
+        keeping any cell found in both.
+        """
+        keys = set((cell['filename'], cell['label']) for cell in cells)
+        old_keys = set((cell['filename'], cell['label']) for cell in self._cells)
+        if keys == old_keys:
+            return
+
+        for (filename, label) in old_keys - keys:
+            self.remove_cell(filename, label)
+        for cell in cells:
+            if (cell['filename'], cell['label']) not in old_keys:
+                self.add_cell(cell['filename'], cell['label'])
+
+    def _follow_status(self, filename, status):
+        """
+        Note whether @status is stale, and wake when it next ages into
+        a new state.
+        """
+        self._any_stale = self._any_stale or status.is_stale
+        self._scheduler.schedule(filename, self._status.get_transition_time(status))
+
+    def _run_ticks(self):
+        """
+        Bring statuses up to date, then sleep until something changes or
+        falls due, until stopped.
+        """
+        self._is_running = True
+        time_last_changed = time.time()
+        while self._is_running:
+            self._refresh_cells()
+            tick_start_time = time.time()
+            any_changes = self._update_statuses()
+            now = time.time()
+            if any_changes:
+                time_last_changed = now
+            if self._metrics:
+                self._metrics.record('status-seconds', now - tick_start_time)
+                self._metrics.log_summary_if_due(now)
+            timeout = self._compute_wait_timeout(now, time_last_changed)
+            self._changed_filenames = self._watcher.wait(timeout, self._get_wake_files())
+            self._handle_wake()
+
+    def _update_statuses(self):
+        """
+        Show or send the latest statuses, returning whether any changed.
+        """
+        raise NotImplementedError()
+
+    def _get_wake_files(self):
+        """
+        Return files besides watched ones to wake on: by default, those
+        of our status, which become readable as checks on workers finish.
+        """
+        if hasattr(self._status, 'get_wake_files'):
+            return self._status.get_wake_files()
+
+        return []
+
+    def _handle_wake(self):
+        pass
+
+    def _compute_wait_timeout(self, now, time_last_changed, deadlines=()):
+        """
+        Sleep until the next file ages into a new state, is due to be
+        polled, or any of the other @deadlines passes. Without per-file
+        polling, poll everything at the hot or cool rate when the watcher
+        can't report every change to us, or a check is still outstanding.
+        """
+        next_check_time = self._status.get_next_check_time()
+        deadlines = (self._scheduler.next_deadline(), next_check_time) + tuple(deadlines)
+        timeouts = [deadline - now + Frontend.DEADLINE_SLACK_SECONDS
+                    for deadline in deadlines if deadline is not None]
+
+        if next_check_time is None and (self._any_stale or not self._watcher.covers_all_changes()):
+            if now - time_last_changed > self._short_sleep_period_seconds:
+                timeouts.append(self._long_sleep_duration)
+            else:
+                timeouts.append(self._short_sleep_duration)
+
+        if not timeouts:
+            return None
+
+        return max(0, min(timeouts))
@@ -0,0 +1,196 @@
+import array
+
+
+# Sparkline levels, lowest first, in plain ASCII so that any terminal
+# can draw them.
+SPARKLINE_LEVELS = '_.-:=+*#'
+SPARKLINE_FAILURE = 'x'
+SPARKLINE_UNKNOWN = ' '
+
+NAN = float('nan')
+
+
+def format_sparkline(values, failures=None):
+    """
+    Draw @values as one character each, scaled to the largest of them.
+    Values which are NaN are unknown and left blank, and those whose
+    entry in @failures is true are drawn as failures.
+    """
+    known = [value for value in values if value == value]
+    highest = max(known) if known else 0
+    top = len(SPARKLINE_LEVELS) - 1
+    characters = []
+    for index, value in enumerate(values):
+        if failures and failures[index]:
+            characters.append(SPARKLINE_FAILURE)
+        elif value != value:
+            characters.append(SPARKLINE_UNKNOWN)
+        elif highest <= 0:
+            characters.append(SPARKLINE_LEVELS[0])
+        else:
+            characters.append(SPARKLINE_LEVELS[int(round(value / highest * top))])
+
+    return ''.join(characters)
+
+
+def format_seconds(seconds):
+    if seconds != seconds:
+        return '-'
+    if seconds < 60:
+        return '%ds' % seconds
+    if seconds < 3600:
+        return '%dm' % (seconds // 60)
+
+    return '%dh' % (seconds // 3600)
+
+
+class History(object):
+    """
+    Class to remember the last few rebuilds of every file: how long after
+    the one before each came, how long it took to write, when that was
+    seen, and whether it succeeded.
+
+    Each file gets a fixed run of entries in flat arrays, used as a ring,
+    so that 10k files take a few MB and recording a rebuild is O(1) and
+    keeps no objects. Slots of removed files are reused.
+    """
+
+    DEFAULT_CAPACITY = 32
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self._capacity = capacity
+        self._slots = {}
+        self._free_slots = []
+        # One per slot.
+        self._counts = array.array('L')
+        self._last_times = array.array('d')
+        # One per entry, `capacity` to a slot.
+        self._intervals = array.array('f')
+        self._durations = array.array('f')
+        self._outcomes = array.array('b')
+
+    def add(self, filename):
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self._counts)
+            self._counts.append(0)
+            self._last_times.append(NAN)
+            self._intervals.extend(array.array('f', [NAN]) * self._capacity)
+            self._durations.extend(array.array('f', [NAN]) * self._capacity)
+            self._outcomes.extend(array.array('b', [0]) * self._capacity)
+        self._counts[slot] = 0
+        self._last_times[slot] = NAN
+        self._slots[filename] = slot
+
+    def remove(self, filename):
+        self._free_slots.append(self._slots.pop(filename))
+
+    def record(self, filename, modified_time, is_success, duration=None):
+        """
+        Record a rebuild of @filename, leaving it at @modified_time. Its
+        @duration is how long it was seen being written, if known.
+        """
+        slot = self._slots[filename]
+        count = self._counts[slot]
+        position = slot * self._capacity + count % self._capacity
+        self._intervals[position] = modified_time - self._last_times[slot] if count else NAN
+        self._durations[position] = NAN if duration is None else duration
+        self._outcomes[position] = 1 if is_success else 0
+        self._last_times[slot] = modified_time
+        self._counts[slot] = count + 1
+
+    def get_change_count(self, filename):
+        """
+        Count every rebuild ever recorded for @filename, so callers can
+        tell when there's something new to show.
+        """
+        slot = self._slots.get(filename)
+        if slot is None:
+            return 0
+
+        return self._counts[slot]
+
+    def get_capacity(self):
+        return self._capacity
+
+    def get_state(self, filename):
+        """
+        Return the change count, last modified time and the raw interval,
+        duration and outcome entries of @filename, for saving.
+        """
+        slot = self._slots.get(filename)
+        if slot is None:
+            return None
+
+        start = slot * self._capacity
+        end = start + self._capacity
+        return (self._counts[slot], self._last_times[slot], self._intervals[start:end].tostring(),
+                self._durations[start:end].tostring(), self._outcomes[start:end].tostring())
+
+    def set_state(self, filename, count, last_time, intervals, durations, outcomes):
+        """
+        Restore the history of @filename from what get_state returned.
+        """
+        slot = self._slots.get(filename)
+        if slot is None:
+            return
+
+        start = slot * self._capacity
+        end = start + self._capacity
+        for (values, raw) in ((self._intervals, intervals), (self._durations, durations),
+                              (self._outcomes, outcomes)):
+            restored = array.array(values.typecode)
+            restored.fromstring(raw)
+            values[start:end] = restored
+        self._counts[slot] = count
+        self._last_times[slot] = last_time
+
+    def get_last_time(self, filename):
+        """
+        Return the modified time of the last rebuild recorded for
+        @filename, or NaN if none has been.
+        """
+        slot = self._slots.get(filename)
+        if slot is None:
+            return NAN
+
+        return self._last_times[slot]
+
+    def get_entries(self, filename, limit=None):
+        """
+        Return the intervals, durations and success flags of up to @limit
+        of the most recent rebuilds of @filename, oldest first.
+        """
+        slot = self._slots.get(filename)
+        if slot is None:
+            return ([], [], [])
+
+        count = self._counts[slot]
+        size = min(count, self._capacity, limit or self._capacity)
+        base = slot * self._capacity
+        positions = [base + (count - size + offset) % self._capacity for offset in range(size)]
+
+        return ([self._intervals[position] for position in positions],
+                [self._durations[position] for position in positions],
+                [self._outcomes[position] == 1 for position in positions])
+
+    def format_sparklines(self, filename, width):
+        """
+        Describe the recent rebuilds of @filename in lines of at most
+        @width characters: one for the time between rebuilds, with failed
+        rebuilds marked, and one for how long they took to write, when
+        that's known. Each ends with its most recent value.
+        """
+        if width < 8:
+            return []
+        (intervals, durations, outcomes) = self.get_entries(filename, width - 6)
+        if len(intervals) < 2:
+            return []
+
+        failures = [not is_success for is_success in outcomes]
+        lines = ['%s %s' % (format_sparkline(intervals, failures), format_seconds(intervals[-1]))]
+        if any(duration == duration for duration in durations):
+            lines.append('%s %s' % (format_sparkline(durations), format_seconds(durations[-1])))
+
+        return lines
@@ -0,0 +1,188 @@
+import collections
+import threading
+
+
+class Histogram(object):
+    """
+    Class to keep the distribution of a quantity's most recent samples,
+    in power of two buckets so that recording is cheap and percentiles
+    need no sorting.
+    """
+
+    DEFAULT_WINDOW_SIZE = 1024
+
+    # Bucket i holds samples below 2**i units; seconds are bucketed in
+    # microseconds and byte counts in bytes.
+    BUCKET_COUNT = 48
+
+    def __init__(self, unit=1.0, window_size=None):
+        self._unit = unit
+        self._samples = collections.deque()
+        self._window_size = window_size or Histogram.DEFAULT_WINDOW_SIZE
+        self._buckets = [0] * Histogram.BUCKET_COUNT
+        self._total = 0
+        self._count = 0
+
+    def record(self, value):
+        bucket = self._bucket(value)
+        self._samples.append((value, bucket))
+        self._buckets[bucket] += 1
+        self._total += value
+        self._count += 1
+        if len(self._samples) > self._window_size:
+            (old_value, old_bucket) = self._samples.popleft()
+            self._buckets[old_bucket] -= 1
+
+    def get_count(self):
+        """
+        Count every sample ever recorded, not only those in the window.
+        """
+        return self._count
+
+    def get_total(self):
+        return self._total
+
+    def get_max(self):
+        if not self._samples:
+            return None
+
+        return max(value for (value, bucket) in self._samples)
+
+    def get_percentile(self, percentile):
+        """
+        Estimate the @percentile of the window, as the upper bound of the
+        bucket it falls in, but no more than the largest sample.
+        """
+        if not self._samples:
+            return None
+
+        rank = percentile / 100.0 * len(self._samples)
+        seen = 0
+        for bucket, count in enumerate(self._buckets):
+            seen += count
+            if count and seen >= rank:
+                return min((1 << bucket) * self._unit, self.get_max())
+
+        return self.get_max()
+
+    def _bucket(self, value):
+        return min(int(value / self._unit).bit_length(), Histogram.BUCKET_COUNT - 1)
+
+
+class Metrics(object):
+    """
+    Class to collect timings and sizes from each tick, safe to record
+    into from worker threads, for an on-screen overlay and a periodic
+    summary in the log.
+    """
+
+    # Timings in seconds, to be bucketed by the microsecond.
+    TIMINGS = ('stat-seconds', 'scan-seconds', 'status-seconds',
+               'redraw-seconds', 'sleep-overshoot-seconds')
+    SIZES = ('scan-bytes',)
+
+    DEFAULT_SUMMARY_PERIOD_SECONDS = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        for name in Metrics.TIMINGS:
+            self._histograms[name] = Histogram(unit=1e-6)
+        for name in Metrics.SIZES:
+            self._histograms[name] = Histogram()
+        self._log = None
+        self._summary_period_seconds = Metrics.DEFAULT_SUMMARY_PERIOD_SECONDS
+        self._last_summary_time = None
+
+    def set_log(self, log):
+        self._log = log
+
+    def set_summary_period_seconds(self, summary_period_seconds):
+        self._summary_period_seconds = summary_period_seconds
+
+    def record(self, name, value):
+        with self._lock:
+            self._histograms[name].record(value)
+
+    def summarize(self):
+        summary = {}
+        with self._lock:
+            for name, histogram in self._histograms.iteritems():
+                summary[name] = {
+                    'count': histogram.get_count(),
+                    'total': histogram.get_total(),
+                    'p50': histogram.get_percentile(50),
+                    'p90': histogram.get_percentile(90),
+                    'max': histogram.get_max()
+                }
+
+        return summary
+
+    def format_overlay(self):
+        """
+        Describe where recent ticks spent their time, in one short line.
+        """
+        summary = self.summarize()
+        parts = []
+        for (label, name) in (('stat', 'stat-seconds'),
+                              ('scan', 'scan-seconds'),
+                              ('status', 'status-seconds'),
+                              ('redraw', 'redraw-seconds'),
+                              ('oversleep', 'sleep-overshoot-seconds')):
+            parts.append('%s %s' % (label, Metrics._format_seconds(summary[name]['p50'])))
+        parts.append('scanned %s' % Metrics._format_bytes(summary['scan-bytes']['total']))
+
+        return '  '.join(parts)
+
+    def log_summary_if_due(self, now):
+        """
+        Write a summary to the log at verbose level, once per summary
+        period.
+        """
+        if not self._log:
+            return
+        if self._last_summary_time is None:
+            self._last_summary_time = now
+            return
+        if now - self._last_summary_time < self._summary_period_seconds:
+            return
+
+        self._last_summary_time = now
+        summary = self.summarize()
+        for name in Metrics.TIMINGS:
+            self._log.verbose('%s: count %d p50 %s p90 %s max %s',
+                              name,
+                              summary[name]['count'],
+                              Metrics._format_seconds(summary[name]['p50']),
+                              Metrics._format_seconds(summary[name]['p90']),
+                              Metrics._format_seconds(summary[name]['max']),
+                              prefix="METRICS")
+        for name in Metrics.SIZES:
+            self._log.verbose('%s: count %d total %s p90 %s',
+                              name,
+                              summary[name]['count'],
+                              Metrics._format_bytes(summary[name]['total']),
+                              Metrics._format_bytes(summary[name]['p90']),
+                              prefix="METRICS")
+
+    @staticmethod
+    def _format_seconds(seconds):
+        if seconds is None:
+            return '-'
+        if seconds < 1e-3:
+            return '%dus' % (seconds * 1e6)
+        if seconds < 1:
+            return '%.1fms' % (seconds * 1e3)
+
+        return '%.2fs' % seconds
+
+    @staticmethod
+    def _format_bytes(size):
+        if size is None:
+            return '-'
+        for unit in ('B', 'KB', 'MB', 'GB'):
+            if size < 1024:
+                return '%d%s' % (size, unit)
+            size /= 1024.0
+
+        return '%dTB' % size
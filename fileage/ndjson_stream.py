@@ -0,0 +1,89 @@
+import errno
+import json
+import sys
+import time
+
+import constants
+from frontend import Frontend
+from watcher import PollingWatcher
+
+
+class NdjsonStream(Frontend):
+    """
+    Class to report state transitions as newline delimited JSON, one
+    object per transition, for other tools to consume without a terminal.
+
+    Nothing is written while nothing changes. Each file's first status is
+    reported as a transition from a null state.
+    """
+
+    def __init__(self):
+        super(NdjsonStream, self).__init__()
+        self._output_handle = sys.stdout
+        self._output_filename = None
+
+    def set_output_handle(self, output_handle):
+        self._output_handle = output_handle
+
+    def set_output_filename(self, output_filename):
+        """
+        Stream to @output_filename, which may be a named pipe, opened when
+        we start running and closed when we stop.
+        """
+        self._output_filename = output_filename
+
+    def run(self):
+        assert self._status, "no status helper object set."
+        if not self._watcher:
+            self._watcher = PollingWatcher()
+
+        if self._output_filename:
+            self._output_handle = open(self._output_filename, 'w')
+
+        try:
+            self._run_ticks()
+        except KeyboardInterrupt:
+            pass
+        except IOError as exception:
+            # Our reader went away, such as the far end of a pipe closing.
+            if exception.errno != errno.EPIPE:
+                raise
+        finally:
+            if self._output_filename:
+                self._output_handle.close()
+
+    def _update_statuses(self):
+        """
+        Write a line for each file whose state changed.
+        """
+        statuses = self._status.get_statuses(self._changed_filenames,
+                                             self._watcher.get_closed_filenames())
+        now = time.time()
+        self._any_stale = False
+        lines = []
+        for cell in self._cells:
+            filename = cell['filename']
+            status = statuses.get(filename)
+            if not status:
+                continue
+            self._follow_status(filename, status)
+
+            old_state = cell.get('state')
+            if old_state == status.state:
+                continue
+            cell['state'] = status.state
+            lines.append(json.dumps({
+                'time': now,
+                'file': filename,
+                'label': cell['label'],
+                'old-state': constants.STATE_NAMES.get(old_state),
+                'new-state': constants.STATE_NAMES[status.state],
+                'age-seconds': status.age_seconds,
+                'scan-seconds': status.scan_seconds
+            }, sort_keys=True))
+
+        if lines:
+            self._output_handle.write('\n'.join(lines) + '\n')
+            self._output_handle.flush()
+
+        return len(lines) > 0
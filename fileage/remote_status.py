@@ -0,0 +1,171 @@
+import json
+import socket
+import time
+
+import constants
+from status_record import StatusRecord
+from watcher import select_readable
+
+
+class RemoteStatus(object):
+    """
+    Class to stand in for Status in a dashboard which only renders,
+    mirroring the statuses published by a StatusDaemon.
+
+    The daemon does all the checking and tells us when a file ages into
+    a new state, so we never schedule anything of our own.
+    """
+
+    CONNECT_TIMEOUT_SECONDS = 5.0
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, socket_filename):
+        self._socket_filename = socket_filename
+        self._socket = None
+        self._buffer = ''
+        self._cells = []
+        self._statuses = {}
+
+    def connect(self):
+        """
+        Connect to the daemon and wait for its snapshot, raising if it
+        isn't there to answer.
+        """
+        try:
+            self._open()
+            self._socket.settimeout(RemoteStatus.CONNECT_TIMEOUT_SECONDS)
+            while not self._cells and self._socket:
+                self.read_messages()
+        except socket.error as exception:
+            self.close()
+            raise Exception('could not reach the daemon at %s: %s' % (self._socket_filename, exception))
+        if not self._socket:
+            raise Exception('the daemon at %s hung up' % self._socket_filename)
+        self._socket.settimeout(None)
+
+    def reconnect(self):
+        """
+        Try once to reach a daemon we lost, returning whether we did. Its
+        snapshot arrives as an ordinary message.
+        """
+        try:
+            self._open()
+        except socket.error:
+            self.close()
+            return False
+
+        return True
+
+    def is_connected(self):
+        return self._socket is not None
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def get_cells(self):
+        """
+        Return the cells of the daemon's latest snapshot, which a
+        dashboard should show in place of its own.
+        """
+        return self._cells
+
+    def get_statuses(self, changed_filenames=None, closed_filenames=None):
+        return self._statuses
+
+    def get_transition_time(self, status):
+        return None
+
+    def get_next_check_time(self):
+        return None
+
+    def read_messages(self):
+        """
+        Take in whatever the daemon has sent, returning the set of
+        filenames whose status changed. If the daemon has gone, every
+        status is marked stale.
+        """
+        try:
+            data = self._socket.recv(RemoteStatus.READ_SIZE)
+        except socket.timeout:
+            raise
+        except socket.error:
+            data = ''
+        if not data:
+            self.close()
+            for status in self._statuses.itervalues():
+                status.is_stale = True
+            return set(self._statuses)
+
+        self._buffer += data
+        lines = self._buffer.split('\n')
+        self._buffer = lines.pop()
+        changed = set()
+        for line in lines:
+            changed.update(self._handle_message(json.loads(line)))
+
+        return changed
+
+    def close(self):
+        if self._socket is None:
+            return
+        self._socket.close()
+        self._socket = None
+        self._buffer = ''
+
+    def _open(self):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(self._socket_filename)
+
+    def _handle_message(self, message):
+        # Filenames go back to byte strings so they match our cells.
+        statuses = dict((filename.encode('utf-8'), StatusRecord.from_dict(status))
+                        for filename, status in message['statuses'].iteritems())
+        if message['type'] == constants.MessageTypes.SNAPSHOT:
+            # Sent on connecting, and again whenever the daemon's cells
+            # change, so it replaces everything we had.
+            self._cells = [{
+                'filename': cell['filename'].encode('utf-8'),
+                'label': cell['label'].encode('utf-8')
+            } for cell in message['cells']]
+            self._statuses = statuses
+            return set(cell['filename'] for cell in self._cells)
+
+        self._statuses.update(statuses)
+        return set(statuses)
+
+
+class RemoteWatcher(object):
+    """
+    Class to wait for news from the daemon behind a RemoteStatus, in
+    place of watching files ourselves. While the daemon is away we try to
+    reconnect whenever the dashboard polls.
+    """
+
+    def __init__(self, remote_status):
+        self._remote_status = remote_status
+
+    def is_event_driven(self):
+        return True
+
+    def covers_all_changes(self):
+        return self._remote_status.is_connected()
+
+    def wait(self, timeout, wake_files=()):
+        if not self._remote_status.is_connected() and not self._remote_status.reconnect():
+            if wake_files:
+                select_readable(list(wake_files), timeout)
+            else:
+                time.sleep(timeout)
+            return None
+
+        readable = select_readable([self._remote_status] + list(wake_files), timeout)
+        if self._remote_status in readable:
+            return self._remote_status.read_messages()
+
+        return set()
+
+    def get_closed_filenames(self):
+        return ()
+
+    def close(self):
+        pass
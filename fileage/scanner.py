@@ -0,0 +1,462 @@
+import hashlib
+import os
+import re
+
+
+# Constructs whose meaning depends upon where the searched string ends
+# or begins. The dashboard's matching rule is "some stripped line of the
+# file matches", which we can only reproduce over the whole file when a
+# pattern has none of these.
+LINE_BOUNDARY_PATTERN = re.compile(r'\$|\\[AZB]|\(\?<?[=!]')
+
+# Constructs which change meaning when a pattern is joined with others
+# into one alternation: backreferences and group names, which would be
+# renumbered or clash, and inline flags, which would apply to them all.
+UNCOMBINABLE_PATTERN = re.compile(r'\\[1-9]|\(\?P|\(\?[iLmsux]')
+
+# Patterns free of these are plain strings, found without a regex.
+REGEX_SYNTAX_PATTERN = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+TRAILING_WHITESPACE = ' \t\r\n\x0b\x0c'
+
+# Read this much at a time when searching back from the end of a file;
+# doubled while a single line doesn't fit.
+TAIL_BLOCK_SIZE = 16 * 1024
+
+# Read this much at a time when searching forwards through a file.
+SEARCH_BLOCK_SIZE = 1024 * 1024
+
+# Read this much at a time when hashing a file.
+DIGEST_BLOCK_SIZE = 1024 * 1024
+
+# Keep at most this much of a failing line, around the match, since a
+# minified bundle may be a single line megabytes long.
+FAILURE_LINE_MAX_BYTES = 200
+
+# Bytes which continue a UTF-8 character rather than start one.
+UTF8_CONTINUATION_BYTE_MIN = '\x80'
+UTF8_CONTINUATION_BYTE_MAX = '\xbf'
+
+
+def is_line_local(pattern):
+    """
+    Indicate whether the compiled @pattern can be run over a whole file
+    and still agree with running it over each stripped line.
+    """
+    return not LINE_BOUNDARY_PATTERN.search(pattern.pattern)
+
+
+class Matcher(object):
+    """
+    Class to look for any number of success and failure patterns in a
+    single pass over a file.
+
+    Patterns which are plain strings are found with a substring search.
+    The remaining success patterns are joined into one alternation, as
+    are the remaining failure patterns, so that each regex pass over the
+    file looks for all of them at once.
+    """
+
+    def __init__(self, success_pattern_strings=(), failure_pattern_strings=()):
+        self._success_units = Matcher._build_units(success_pattern_strings, False)
+        self._failure_units = Matcher._build_units(failure_pattern_strings, True)
+        self._is_line_local = all(unit.is_line_local()
+                                  for unit in self._success_units + self._failure_units)
+
+    def has_success_patterns(self):
+        return len(self._success_units) > 0
+
+    def has_failure_patterns(self):
+        return len(self._failure_units) > 0
+
+    def get_units(self, is_success_seen):
+        """
+        The units still worth looking for, once a success has or hasn't
+        been seen.
+        """
+        if is_success_seen:
+            return self._failure_units
+
+        return self._success_units + self._failure_units
+
+    def is_line_local(self):
+        return self._is_line_local
+
+    @staticmethod
+    def _build_units(pattern_strings, is_failure):
+        units = []
+        combinable = []
+        for pattern_string in pattern_strings:
+            if not REGEX_SYNTAX_PATTERN.search(pattern_string):
+                units.append(_LiteralUnit(pattern_string, is_failure))
+            elif UNCOMBINABLE_PATTERN.search(pattern_string):
+                units.append(_RegexUnit(re.compile(pattern_string, re.MULTILINE), is_failure))
+            else:
+                combinable.append(pattern_string)
+
+        if combinable:
+            combined = '|'.join('(?:%s)' % pattern_string for pattern_string in combinable)
+            units.append(_RegexUnit(re.compile(combined, re.MULTILINE), is_failure))
+
+        return units
+
+
+class _LiteralUnit(object):
+
+    def __init__(self, literal, is_failure):
+        self.literal = literal
+        self.is_failure = is_failure
+
+    def is_line_local(self):
+        return True
+
+    def find_line(self, text, position, size):
+        """
+        Find the first line at or after @position whose stripped form
+        contains our literal, returning its start and end offsets and
+        those of the match.
+        """
+        while position < size:
+            start = text.find(self.literal, position, size)
+            if start < 0:
+                return None
+
+            (line_start, line_end) = _line_bounds(text, start, size)
+            if start + len(self.literal) <= _stripped_end(text, line_start, line_end):
+                return (line_start, line_end, start)
+            position = line_end + 1
+
+        return None
+
+    def matches_line(self, line):
+        return self.literal in line
+
+    def find_in_line(self, line):
+        return line.find(self.literal)
+
+
+class _RegexUnit(object):
+
+    def __init__(self, pattern, is_failure):
+        self.pattern = pattern
+        self.is_failure = is_failure
+
+    def is_line_local(self):
+        return is_line_local(self.pattern)
+
+    def find_line(self, text, position, size):
+        """
+        Find the first line at or after @position which our pattern
+        matches, returning its start and end offsets and those of the
+        match. Each candidate match
+        is checked against its own line, since a pattern like `[^x]+` may
+        otherwise match across a newline.
+        """
+        while position < size:
+            match = self.pattern.search(text, position, size)
+            if not match:
+                return None
+
+            (line_start, line_end) = _line_bounds(text, match.start(), size)
+            if match.end() <= _stripped_end(text, line_start, line_end):
+                return (line_start, line_end, match.start())
+
+            # Rare: the match ran past the line, so retry within the line alone.
+            start = self.find_in_line(text[line_start:line_end].rstrip())
+            if start >= 0:
+                return (line_start, line_end, line_start + start)
+            position = line_end + 1
+
+        return None
+
+    def matches_line(self, line):
+        return self.pattern.search(line) is not None
+
+    def find_in_line(self, line):
+        match = self.pattern.search(line)
+        if not match:
+            return -1
+
+        return match.start()
+
+
+def _line_bounds(text, position, size):
+    line_start = text.rfind('\n', 0, position) + 1
+    line_end = text.find('\n', position)
+    if line_end < 0:
+        line_end = size
+
+    return (line_start, line_end)
+
+
+def _stripped_end(text, line_start, line_end):
+    stripped_end = line_end
+    while stripped_end > line_start and text[stripped_end - 1] in TRAILING_WHITESPACE:
+        stripped_end -= 1
+
+    return stripped_end
+
+
+def _excerpt(text, line_start, line_end, match_start):
+    """
+    Cut the line of @text between @line_start and @line_end, stripped of
+    trailing whitespace, down to FAILURE_LINE_MAX_BYTES around the match
+    at @match_start, without copying the rest of the line. The cuts are
+    moved to UTF-8 character boundaries, so that no character is split.
+    """
+    line_end = _stripped_end(text, line_start, line_end)
+    if line_end - line_start > FAILURE_LINE_MAX_BYTES:
+        # Show a little of what leads up to the match.
+        cut_start = max(line_start, min(match_start - FAILURE_LINE_MAX_BYTES // 4,
+                                        line_end - FAILURE_LINE_MAX_BYTES))
+        cut_end = cut_start + FAILURE_LINE_MAX_BYTES
+        if cut_start > line_start:
+            cut_start = _character_start(text, cut_start, cut_end)
+        if cut_end < line_end:
+            cut_end = _character_start(text, cut_end, cut_start)
+        (line_start, line_end) = (cut_start, cut_end)
+
+    return text[line_start:line_end]
+
+
+def _character_start(text, position, limit):
+    """
+    Step @position towards @limit, by at most the three bytes a UTF-8
+    character may continue for, until it's no longer within a character.
+    Text which isn't UTF-8 is left as it is.
+    """
+    step = 1 if limit > position else -1
+    for candidate in xrange(position, position + 4 * step, step):
+        if candidate == limit:
+            break
+        if not UTF8_CONTINUATION_BYTE_MIN <= text[candidate] <= UTF8_CONTINUATION_BYTE_MAX:
+            return candidate
+
+    return position
+
+
+def _excerpt_line(line, unit):
+    return _excerpt(line, 0, len(line), max(unit.find_in_line(line), 0))
+
+
+def digest(filename, block_size=DIGEST_BLOCK_SIZE):
+    """
+    Hash the content of @filename, reading it a block at a time, since a
+    file truncated while memory mapped would kill us with SIGBUS.
+    """
+    hasher = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), ''):
+            hasher.update(block)
+
+    return hasher.digest()
+
+
+def search(filename, matcher, offset=0, is_success_seen=False, is_complete_lines_only=False):
+    """
+    Search @filename from @offset, which must be the start of a line, for
+    lines matching the success and failure patterns of @matcher. Stops at
+    the first failure, or at the first success if there are no failure
+    patterns to rule out.
+
+    With @is_complete_lines_only, a last line with no newline yet is left
+    alone, since whatever is still being written to it could change
+    whether it matches.
+
+    Returns whether a success was seen, the first failing line or None,
+    and the offset just past the last complete line scanned, so that an
+    appended file may be resumed from there.
+    """
+    if matcher.is_line_local():
+        return search_blocks(filename, matcher, offset, is_success_seen, is_complete_lines_only)
+
+    return search_lines(filename, matcher, offset, is_success_seen, is_complete_lines_only)
+
+
+def search_blocks(filename, matcher, offset=0, is_success_seen=False,
+                  is_complete_lines_only=False, block_size=SEARCH_BLOCK_SIZE):
+    """
+    Search the file a block of whole lines at a time, avoiding a string
+    per line. The partial line at the end of each block is carried into
+    the next. Plain reads are used rather than a memory map, since a file
+    truncated while mapped kills the process with SIGBUS, and bundlers
+    truncate their output to rewrite it.
+    """
+    pending = []
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            if '\n' not in block:
+                # Still within one long line.
+                pending.append(block)
+                continue
+            if pending:
+                pending.append(block)
+                block = ''.join(pending)
+                pending = []
+
+            (is_success_seen, failure_line, end) = _search_text(block, matcher, 0,
+                                                                is_success_seen, True)
+            if failure_line is not None or (is_success_seen and
+                                            not matcher.has_failure_patterns()):
+                return (is_success_seen, failure_line, offset + end)
+            offset += end
+            if end < len(block):
+                pending.append(block[end:])
+
+    if pending and not is_complete_lines_only:
+        (is_success_seen, failure_line, end) = _search_text(''.join(pending), matcher, 0,
+                                                            is_success_seen)
+        return (is_success_seen, failure_line, offset + end)
+
+    return (is_success_seen, None, offset)
+
+
+def _search_text(text, matcher, offset, is_success_seen, is_complete_lines_only=False):
+    """
+    Step from one matching line to the next across all the units at once.
+    Each unit's next match is remembered until we pass it, so no unit
+    searches any stretch of @text twice.
+    """
+    size = len(text)
+    if is_complete_lines_only:
+        size = max(text.rfind('\n', offset) + 1, offset)
+    position = offset
+    next_lines = {}
+    units = matcher.get_units(is_success_seen)
+    while units and position < size:
+        earliest = None
+        for unit in units:
+            line = next_lines.get(unit, False)
+            if line is False or (line and line[0] < position):
+                line = unit.find_line(text, position, size)
+                next_lines[unit] = line
+            if line and (not earliest or line[0] < earliest[0][0] or
+                         (line[0] == earliest[0][0] and unit.is_failure)):
+                earliest = (line, unit)
+        if not earliest:
+            break
+
+        ((line_start, line_end, match_start), unit) = earliest
+        if unit.is_failure:
+            failure_line = _excerpt(text, line_start, line_end, match_start)
+            return (is_success_seen, failure_line, min(line_end + 1, size))
+
+        is_success_seen = True
+        if not matcher.has_failure_patterns():
+            return (True, None, min(line_end + 1, size))
+        units = matcher.get_units(is_success_seen)
+        position = line_end + 1
+
+    return (is_success_seen, None, text.rfind('\n', offset, size) + 1 or offset)
+
+
+def search_lines(filename, matcher, offset=0, is_success_seen=False,
+                 is_complete_lines_only=False):
+    """
+    Search one stripped line at a time, for patterns which the block
+    search can't handle.
+    """
+    with open(filename, 'r') as f:
+        f.seek(offset)
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            if line.endswith('\n'):
+                offset += len(line)
+            elif is_complete_lines_only:
+                break
+            line = line.rstrip()
+            for unit in matcher.get_units(is_success_seen):
+                if not unit.matches_line(line):
+                    continue
+                if unit.is_failure:
+                    return (is_success_seen, _excerpt_line(line, unit), offset)
+                is_success_seen = True
+            if is_success_seen and not matcher.has_failure_patterns():
+                break
+
+    return (is_success_seen, None, offset)
+
+
+def search_tail(filename, matcher, limit_bytes=None, block_size=TAIL_BLOCK_SIZE):
+    """
+    Search @filename backwards from its end, a block at a time, for the
+    markers build tools write last. Each block is cut back to whole lines,
+    leaving the partial line at its start to the block before, so no line
+    is ever split between two searches. With @limit_bytes only the lines
+    wholly within that many bytes of the end are searched.
+
+    Returns whether a success was seen, the first failing line in the
+    searched range or None, and how many bytes were read.
+    """
+    is_success_seen = False
+    failure_line = None
+    bytes_read = 0
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        lower = 0
+        if limit_bytes is not None and end > limit_bytes:
+            lower = end - limit_bytes
+
+        while end > lower:
+            start = max(lower, end - block_size)
+            if start == 0:
+                f.seek(0)
+                block = f.read(end)
+                bytes_read += len(block)
+                next_end = 0
+            else:
+                # Read one byte early, to see whether `start` begins a line.
+                f.seek(start - 1)
+                data = f.read(end - start + 1)
+                bytes_read += len(data)
+                cut = data.find('\n', 0, len(data) - 1) + 1
+                if not cut:
+                    if start == lower:
+                        break
+                    block_size *= 2
+                    continue
+                block = data[cut:]
+                # Any partial line before the cut is outside our limit.
+                next_end = start - 1 + cut if start > lower else lower
+
+            (is_block_success, block_failure_line) = _search_block(block, matcher)
+            is_success_seen = is_success_seen or is_block_success
+            if block_failure_line is not None:
+                failure_line = block_failure_line
+            if is_success_seen and not matcher.has_failure_patterns():
+                break
+            end = next_end
+
+    return (is_success_seen, failure_line, bytes_read)
+
+
+def _search_block(block, matcher):
+    """
+    Search a string of whole lines, returning whether a success was seen
+    and the first failing line or None.
+    """
+    if matcher.is_line_local():
+        (is_success_seen, failure_line, offset) = _search_text(block, matcher, 0, False)
+        return (is_success_seen, failure_line)
+
+    lines = block.split('\n')
+    if block.endswith('\n'):
+        lines.pop()
+    is_success_seen = False
+    for line in lines:
+        line = line.rstrip()
+        for unit in matcher.get_units(is_success_seen):
+            if not unit.matches_line(line):
+                continue
+            if unit.is_failure:
+                return (is_success_seen, _excerpt_line(line, unit))
+            is_success_seen = True
+
+    return (is_success_seen, None)
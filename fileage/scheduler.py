@@ -0,0 +1,68 @@
+import heapq
+
+
+class Scheduler(object):
+    """
+    Class to track the next time each key is due, answering which is due
+    soonest in O(1) and rescheduling in O(log n).
+
+    Rescheduled or cancelled entries are left in the heap and skipped when
+    they surface, rather than searched for and removed.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._deadlines = {}
+
+    def schedule(self, key, deadline):
+        """
+        Set when @key is next due, replacing any earlier schedule. A
+        @deadline of None cancels it.
+        """
+        if deadline is None:
+            self.cancel(key)
+            return
+        if self._deadlines.get(key) == deadline:
+            return
+
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._compact()
+
+    def cancel(self, key):
+        self._deadlines.pop(key, None)
+
+    def get_deadline(self, key):
+        return self._deadlines.get(key)
+
+    def next_deadline(self):
+        while self._heap:
+            (deadline, key) = self._heap[0]
+            if self._deadlines.get(key) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+
+        return None
+
+    def pop_due(self, now):
+        """
+        Remove and return the keys due at or before @now, soonest first.
+        """
+        due = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                break
+            (deadline, key) = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            due.append(key)
+
+        return due
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def _compact(self):
+        self._heap = [(deadline, key) for (key, deadline) in self._deadlines.iteritems()]
+        heapq.heapify(self._heap)
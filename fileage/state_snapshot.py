@@ -0,0 +1,237 @@
+import mmap
+import os
+import struct
+import time
+
+
+class StateSnapshot(object):
+    """
+    Class to save what Status has learned of every file to a compact
+    binary file, and to load it back at startup so that the first paint
+    shows each file as we last saw it, and files whose inode, size and
+    modified time are unchanged aren't scanned again.
+
+    The file is a header, one fixed size entry per file, then a fixed size
+    run of history per entry when there's history, then one table of the
+    strings the entries point into. It's loaded through mmap, reading only
+    the bytes each entry points at. Values are in native byte order, since
+    a snapshot is only meant for the machine which wrote it.
+    """
+
+    MAGIC = 'FAGS'
+    VERSION = 2
+    DEFAULT_PERIOD_SECONDS = 60
+
+    # magic, version, entry count, history capacity, string table offset.
+    HEADER = struct.Struct('=4sIIIQ')
+    # Offsets and lengths into the string table of the filename, the path
+    # checked, the failure line and the content digest, then the pattern
+    # key, the inode, size and modified time the scan result is good for,
+    # those the content was last hashed at, the modified time of the file,
+    # whether it succeeded, and flags.
+    ENTRY = struct.Struct('=IIIIIIIIIQQdQQddBB')
+    # Change count and last modified time, followed by the history entries.
+    HISTORY_HEAD = struct.Struct('=Qd')
+
+    FLAG_FINGERPRINT = 1
+    FLAG_FAILURE_LINE = 2
+    FLAG_HISTORY = 4
+    FLAG_CONTENT = 8
+
+    def __init__(self):
+        self._filename = None
+        self._status = None
+        self._history = None
+        self._log = None
+        self._period_seconds = StateSnapshot.DEFAULT_PERIOD_SECONDS
+        self._last_save_time = None
+
+    def set_filename(self, filename):
+        self._filename = filename
+
+    def set_status(self, status):
+        self._status = status
+
+    def set_history(self, history):
+        self._history = history
+
+    def set_log(self, log):
+        self._log = log
+
+    def set_period_seconds(self, period_seconds):
+        """
+        Save every @period_seconds while running, as well as on shutdown.
+        Zero saves only on shutdown.
+        """
+        self._period_seconds = period_seconds
+
+    def save_if_due(self, now):
+        if self._last_save_time is None:
+            self._last_save_time = now
+            return
+        if self._period_seconds and now - self._last_save_time >= self._period_seconds:
+            self.save()
+            self._last_save_time = now
+
+    def save(self):
+        """
+        Write the snapshot next to its final place and move it there, so
+        that a reader never sees half of one.
+        """
+        assert self._filename, "no snapshot filename set."
+        capacity = self._history.get_capacity() if self._history else 0
+        strings = []
+        strings_length = [0]
+
+        def add_string(value):
+            offset = strings_length[0]
+            strings.append(value)
+            strings_length[0] += len(value)
+            return (offset, len(value))
+
+        entries = []
+        history_blocks = []
+        for (filename, path, pattern_key, fingerprint, modified_time, is_success,
+             failure_line, content) in self._status.export_state():
+            flags = 0
+            (inode, size, mtime) = (0, 0, 0.0)
+            if fingerprint is not None:
+                flags |= StateSnapshot.FLAG_FINGERPRINT
+                (inode, size, mtime) = fingerprint
+            ((content_inode, content_size, content_mtime), content_digest) = ((0, 0, 0.0), '')
+            if content is not None:
+                flags |= StateSnapshot.FLAG_CONTENT
+                ((content_inode, content_size, content_mtime), content_digest) = content
+            if failure_line is not None:
+                flags |= StateSnapshot.FLAG_FAILURE_LINE
+            history_state = self._history.get_state(filename) if self._history else None
+            if history_state:
+                flags |= StateSnapshot.FLAG_HISTORY
+                (count, last_time, intervals, durations, outcomes) = history_state
+                history_blocks.append(StateSnapshot.HISTORY_HEAD.pack(count, last_time) +
+                                      intervals + durations + outcomes)
+            elif capacity:
+                history_blocks.append('\0' * self._get_history_block_size(capacity))
+            entries.append(StateSnapshot.ENTRY.pack(*(add_string(filename) +
+                                                      add_string(path) +
+                                                      add_string(failure_line or '') +
+                                                      add_string(content_digest) +
+                                                      (pattern_key, inode, size, mtime,
+                                                       content_inode, content_size, content_mtime,
+                                                       modified_time, 1 if is_success else 0,
+                                                       flags))))
+
+        strings_offset = (StateSnapshot.HEADER.size + len(entries) * StateSnapshot.ENTRY.size +
+                          len(history_blocks) * self._get_history_block_size(capacity))
+        header = StateSnapshot.HEADER.pack(StateSnapshot.MAGIC, StateSnapshot.VERSION,
+                                           len(entries), capacity, strings_offset)
+        temporary_filename = '%s.tmp' % self._filename
+        try:
+            with open(temporary_filename, 'wb') as output_handle:
+                output_handle.write(header)
+                output_handle.write(''.join(entries))
+                output_handle.write(''.join(history_blocks))
+                output_handle.write(''.join(strings))
+            os.rename(temporary_filename, self._filename)
+        except (IOError, OSError) as exception:
+            if self._log:
+                self._log.warning('could not save the state snapshot: %s', exception)
+            return False
+
+        if self._log:
+            self._log.verbose('saved the state of %d files', len(entries))
+
+        return True
+
+    def load(self):
+        """
+        Hand the saved state of every file to our Status, and History if
+        any, returning how many files' state was used. A snapshot which is
+        missing, damaged or from another version is ignored, leaving us to
+        start cold.
+        """
+        assert self._filename, "no snapshot filename set."
+        self._last_save_time = time.time()
+        try:
+            with open(self._filename, 'rb') as input_handle:
+                mapped = mmap.mmap(input_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError) as exception:
+            # An empty file can't be mapped, and raises ValueError.
+            if self._log:
+                self._log.verbose('no state snapshot loaded: %s', exception)
+            return 0
+
+        try:
+            return self._load_mapped(mapped)
+        except (ValueError, struct.error) as exception:
+            if self._log:
+                self._log.warning('ignoring the state snapshot: %s', exception)
+            return 0
+        finally:
+            mapped.close()
+
+    def _load_mapped(self, mapped):
+        (magic, version, entry_count, capacity, strings_offset) = \
+            StateSnapshot.HEADER.unpack_from(mapped, 0)
+        if magic != StateSnapshot.MAGIC or version != StateSnapshot.VERSION:
+            raise ValueError('not a version %d snapshot' % StateSnapshot.VERSION)
+        history_block_size = self._get_history_block_size(capacity)
+        history_offset = StateSnapshot.HEADER.size + entry_count * StateSnapshot.ENTRY.size
+        if history_offset + entry_count * history_block_size != strings_offset or \
+                strings_offset > len(mapped):
+            raise ValueError('truncated snapshot')
+        use_history = (self._history is not None and capacity and
+                       capacity == self._history.get_capacity())
+
+        def get_string(offset, length):
+            start = strings_offset + offset
+            if start + length > len(mapped):
+                raise ValueError('truncated snapshot')
+            return mapped[start:start + length]
+
+        entries = []
+        histories = []
+        for index in range(entry_count):
+            (filename_offset, filename_length, path_offset, path_length, failure_offset,
+             failure_length, digest_offset, digest_length, pattern_key, inode, size, mtime,
+             content_inode, content_size, content_mtime, modified_time, is_success,
+             flags) = StateSnapshot.ENTRY.unpack_from(mapped,
+                                                      StateSnapshot.HEADER.size +
+                                                      index * StateSnapshot.ENTRY.size)
+            filename = intern(get_string(filename_offset, filename_length))
+            fingerprint = None
+            if flags & StateSnapshot.FLAG_FINGERPRINT:
+                fingerprint = (inode, size, mtime)
+            failure_line = None
+            if flags & StateSnapshot.FLAG_FAILURE_LINE:
+                failure_line = get_string(failure_offset, failure_length)
+            content = None
+            if flags & StateSnapshot.FLAG_CONTENT:
+                content = ((content_inode, content_size, content_mtime),
+                           get_string(digest_offset, digest_length))
+            entries.append((filename, get_string(path_offset, path_length), pattern_key,
+                            fingerprint, modified_time, is_success == 1, failure_line, content))
+            if use_history and flags & StateSnapshot.FLAG_HISTORY:
+                histories.append((filename, history_offset + index * history_block_size))
+
+        filenames = self._status.import_state(entries)
+        for (filename, offset) in histories:
+            if filename in filenames:
+                (count, last_time) = StateSnapshot.HISTORY_HEAD.unpack_from(mapped, offset)
+                start = offset + StateSnapshot.HISTORY_HEAD.size
+                self._history.set_state(filename, count, last_time,
+                                        mapped[start:start + capacity * 4],
+                                        mapped[start + capacity * 4:start + capacity * 8],
+                                        mapped[start + capacity * 8:start + capacity * 9])
+
+        if self._log:
+            self._log.verbose('loaded the state of %d files', len(filenames))
+
+        return len(filenames)
+
+    def _get_history_block_size(self, capacity):
+        if not capacity:
+            return 0
+
+        # A float interval, a float duration and a byte outcome per entry.
+        return StateSnapshot.HISTORY_HEAD.size + capacity * 9
@@ -1,9 +1,16 @@
 import os
 import sys
+import threading
 import time
-import re
+import zlib
 
+import cache
 import constants
+import scanner
+from directory_index import DirectoryIndex
+from scheduler import Scheduler
+from status_record import StatusRecord
+from worker_pool import WorkerPool
 
 class Status(object):
     """
@@ -12,75 +19,810 @@ class Status(object):
 
     def __init__(self):
         self._filenames = []
-        self._success_patterns = {}
+        self._matchers = {}
+        self._scan_modes = {}
+        self._success_anchors = {}
+        self._tail_limit_bytes = {}
+        self._detect_modes = {}
+        self._content_states = {}
+        self._scan_progress = {}
+        self._directory_indexes = {}
+        self._directory_full_refresh_seconds = DirectoryIndex.DEFAULT_FULL_REFRESH_SECONDS
         self._new_age_seconds = 3
         self._young_age_seconds = 10
+        self._success_cache = cache.FingerprintCache()
+        self._worker_pool = None
+        self._is_scanning_only_on_workers = False
+        self._tick_deadline_seconds = 0.2
+        self._in_flight = set()
+        self._abandoned_filenames = set()
+        self._records = {}
+        self._min_poll_seconds = 0.3
+        self._max_poll_seconds = None
+        self._poll_backoff = 2.0
+        self._poll_seconds = {}
+        self._check_scheduler = Scheduler()
+        self._metrics = None
+        self._stat_lock = threading.Lock()
+        self._tick_stat_seconds = 0.0
+        self._tick_stat_count = 0
+        self._classifier = None
+        self._indexes = {}
+        self._stale_filenames = set()
+        self._quiet_period_seconds = 0
+        self._write_observations = {}
+        self._history = None
+        self._write_start_times = {}
+        self._pattern_keys = {}
+        self._state_snapshot = None
+
+    def set_metrics(self, metrics):
+        """
+        Record how long stats and scans take, and how much is scanned,
+        into @metrics. Stats are summed over each tick, for one sample a
+        tick rather than one a file.
+        """
+        self._metrics = metrics
+
+    def set_classifier(self, classifier):
+        """
+        Bring states up to date with @classifier, in one pass over all
+        files, touching only the records of files whose state changed.
+        Their `age-seconds` is then only current for files which were
+        checked or changed state this tick.
+        """
+        self._classifier = classifier
+        self._classifier.set_age_thresholds(self._new_age_seconds, self._young_age_seconds)
+        for filename in self._filenames:
+            self._indexes[filename] = self._classifier.add()
+            record = self._records[filename]
+            self._classifier.update(self._indexes[filename], record.modified_time,
+                                    record.is_success, record.is_writing)
+
+    def set_history(self, history):
+        """
+        Record each rebuild of every file into @history.
+        """
+        self._history = history
+        for filename in self._filenames:
+            self._history.add(filename)
+
+    def set_state_snapshot(self, state_snapshot):
+        """
+        Give @state_snapshot the chance to save our state on each call to
+        get_statuses.
+        """
+        self._state_snapshot = state_snapshot
 
     def set_new_age_seconds(self, new_age_seconds):
         self._new_age_seconds = new_age_seconds
+        if self._classifier:
+            self._classifier.set_age_thresholds(self._new_age_seconds, self._young_age_seconds)
 
     def set_young_age_seconds(self, young_age_seconds):
         self._young_age_seconds = young_age_seconds
+        if self._classifier:
+            self._classifier.set_age_thresholds(self._new_age_seconds, self._young_age_seconds)
+
+    def set_quiet_period_seconds(self, quiet_period_seconds):
+        """
+        Treat a file as still being written until its size and modified
+        time have held for @quiet_period_seconds, leaving its success scan
+        until then. Zero scans files as soon as they change.
+        """
+        self._quiet_period_seconds = quiet_period_seconds
+
+    def set_success_cache_size(self, success_cache_size):
+        self._success_cache.set_max_entries(success_cache_size)
+
+    def set_worker_count(self, worker_count, is_scanning_only_on_workers=False):
+        """
+        Check files on @worker_count threads rather than one after another,
+        for files on slow network mounts. Zero checks them in the caller.
+
+        With @is_scanning_only_on_workers, files are statted in the caller
+        and only handed over when they need scanning or hashing, so that a
+        huge file holds nothing up while the cached majority is checked
+        without the cost of a round trip through the workers.
+        """
+        self._is_scanning_only_on_workers = is_scanning_only_on_workers
+        if self._worker_pool:
+            self._worker_pool.close()
+            self._worker_pool = None
+            # Checks which hadn't finished are dropped, so start them again.
+            for filename in self._in_flight - self._abandoned_filenames:
+                self._check_scheduler.schedule(filename, 0)
+            self._in_flight.clear()
+            self._abandoned_filenames.clear()
+        if worker_count > 0:
+            self._worker_pool = WorkerPool(worker_count)
+
+    def get_wake_files(self):
+        """
+        Return the files to select on alongside a watcher's, which become
+        readable when a check running on a worker finishes, so that its
+        result can be shown without waiting for the next tick.
+        """
+        if not self._worker_pool:
+            return []
+
+        return [self._worker_pool.get_wake_fd()]
+
+    def rescan(self):
+        """
+        Forget every cached scan result and check every file again on the
+        next call to get_statuses, scanning each from the start.
+        """
+        self._success_cache.clear()
+        self._scan_progress.clear()
+        for filename in self._filenames:
+            self._check_scheduler.schedule(filename, 0)
+
+    def set_tick_deadline_seconds(self, tick_deadline_seconds):
+        self._tick_deadline_seconds = tick_deadline_seconds
+
+    def set_min_poll_seconds(self, min_poll_seconds):
+        self._min_poll_seconds = min_poll_seconds
+
+    def set_max_poll_seconds(self, max_poll_seconds):
+        """
+        Give each file its own polling interval, starting at
+        `min_poll_seconds` and growing by `poll_backoff` each time we find
+        it unchanged, up to @max_poll_seconds. A change snaps it back to
+        the minimum. None checks every file on every call.
+        """
+        self._max_poll_seconds = max_poll_seconds
+
+    def set_poll_backoff(self, poll_backoff):
+        self._poll_backoff = poll_backoff
+
+    def get_next_check_time(self):
+        """
+        Find when the next file is due to be checked, or None if all files
+        are checked on every call to get_statuses.
+        """
+        if self._max_poll_seconds is None:
+            return None
+
+        return self._check_scheduler.next_deadline()
+
+    def close(self):
+        self.set_worker_count(0)
 
-    def add_filename(self, filename, success_pattern_string=None):
+    def set_directory_full_refresh_seconds(self, directory_full_refresh_seconds):
+        self._directory_full_refresh_seconds = directory_full_refresh_seconds
+        for directory_index in self._directory_indexes.itervalues():
+            directory_index.set_full_refresh_seconds(directory_full_refresh_seconds)
+
+    def add_directory(self, directory, success_pattern_string=None, scan_mode=None,
+                      include_patterns=None, exclude_patterns=None,
+                      failure_pattern_strings=None, success_anchor=None, tail_limit_bytes=None,
+                      detect_mode=None):
+        """
+        Watch the newest file below @directory whose path relative to it
+        matches one of the @include_patterns globs, if any, and none of
+        the @exclude_patterns.
+        """
+        directory = intern(directory)
+        self.add_filename(directory, success_pattern_string, scan_mode, failure_pattern_strings,
+                          success_anchor, tail_limit_bytes, detect_mode)
+        directory_index = DirectoryIndex(directory, include_patterns, exclude_patterns)
+        directory_index.set_full_refresh_seconds(self._directory_full_refresh_seconds)
+        self._directory_indexes[directory] = directory_index
+
+    def add_filename(self, filename, success_pattern_string=None, scan_mode=None,
+                     failure_pattern_strings=None, success_anchor=None, tail_limit_bytes=None,
+                     detect_mode=None):
+        """
+        Watch @filename, which succeeds if some line matches the
+        @success_pattern_string, when given, and no line matches any of
+        the @failure_pattern_strings.
+
+        A `tail` @success_anchor searches full scans back from the end of
+        the file, where build tools write their success markers, and only
+        the last @tail_limit_bytes of it when given.
+
+        A `content` @detect_mode only counts the file as changed when its
+        content does, so that one rewritten with the same bytes keeps its
+        age.
+
+        Bad options raise before anything is changed.
+        """
+        (matcher, scan_mode, success_anchor, detect_mode) = self.compile_options(
+            filename, success_pattern_string, scan_mode, failure_pattern_strings,
+            success_anchor, detect_mode)
+        filename = intern(filename)
         self._filenames.append(filename)
-        if success_pattern_string:
-            self._success_patterns[filename] = re.compile(success_pattern_string, re.MULTILINE);
+        self._records[filename] = StatusRecord()
+        if self._classifier:
+            self._indexes[filename] = self._classifier.add()
+        if self._history:
+            self._history.add(filename)
+        if matcher:
+            self._matchers[filename] = matcher
+        self._scan_modes[filename] = scan_mode
+        self._success_anchors[filename] = success_anchor
+        self._tail_limit_bytes[filename] = tail_limit_bytes
+        self._detect_modes[filename] = detect_mode
+        # Saved scan results are only good for the same patterns and scan.
+        self._pattern_keys[filename] = zlib.crc32(repr((
+            [success_pattern_string] if success_pattern_string else [],
+            failure_pattern_strings or [], scan_mode, success_anchor, tail_limit_bytes,
+            detect_mode))) & 0xffffffff
+        self._check_scheduler.schedule(filename, 0)
+
+    def compile_options(self, filename, success_pattern_string=None, scan_mode=None,
+                        failure_pattern_strings=None, success_anchor=None, detect_mode=None):
+        """
+        Check the options add_filename takes for @filename, raising if any
+        are bad, such as a pattern which doesn't compile. Returns the
+        Matcher of its patterns, or None without any, and its scan mode,
+        success anchor and detect mode with their defaults filled in.
+        """
+        matcher = None
+        success_pattern_strings = [success_pattern_string] if success_pattern_string else []
+        if success_pattern_strings or failure_pattern_strings:
+            matcher = scanner.Matcher(success_pattern_strings, failure_pattern_strings or [])
+        scan_mode = scan_mode or constants.ScanModes.FULL
+        if scan_mode not in (constants.ScanModes.FULL, constants.ScanModes.INCREMENTAL):
+            raise Exception('unknown scan mode: %s' % scan_mode)
+        success_anchor = success_anchor or constants.SuccessAnchors.HEAD
+        if success_anchor not in (constants.SuccessAnchors.HEAD, constants.SuccessAnchors.TAIL):
+            raise Exception('unknown success anchor: %s' % success_anchor)
+        if (success_anchor == constants.SuccessAnchors.TAIL and
+                scan_mode == constants.ScanModes.INCREMENTAL):
+            raise Exception('a tail success anchor needs the full scan mode: %s' % filename)
+        detect_mode = detect_mode or constants.DetectModes.MTIME
+        if detect_mode not in (constants.DetectModes.MTIME, constants.DetectModes.CONTENT):
+            raise Exception('unknown detect mode: %s' % detect_mode)
+
+        return (matcher, scan_mode, success_anchor, detect_mode)
+
+    def remove_filename(self, filename):
+        """
+        Stop watching @filename, or a directory added with add_directory,
+        leaving what we know of every other file as it is. Its cached scan
+        results go too, in case it's added back with other patterns.
+        """
+        record = self._records.pop(filename)
+        self._success_cache.discard(filename)
+        if record.newest_filename:
+            self._success_cache.discard(record.newest_filename)
+
+        # Move the last file into the gap, keeping positions and classifier
+        # indices the same.
+        index = self._filenames.index(filename)
+        last_filename = self._filenames.pop()
+        if last_filename != filename:
+            self._filenames[index] = last_filename
+        if self._classifier:
+            self._classifier.remove(self._indexes.pop(filename))
+            if last_filename != filename:
+                self._indexes[last_filename] = index
+
+        if self._history:
+            self._history.remove(filename)
+
+        for values in (self._matchers, self._scan_modes, self._success_anchors,
+                       self._tail_limit_bytes, self._scan_progress, self._directory_indexes,
+                       self._poll_seconds, self._write_observations, self._write_start_times,
+                       self._pattern_keys, self._detect_modes, self._content_states):
+            values.pop(filename, None)
+        self._check_scheduler.cancel(filename)
+        self._stale_filenames.discard(filename)
+        if filename in self._in_flight:
+            # Its check is still running; drop the result when it comes.
+            self._abandoned_filenames.add(filename)
 
-    def get_statuses(self):
-        statuses = {}
+    def get_statuses(self, changed_filenames=None, closed_filenames=None):
+        """
+        Find the status of every file. With adaptive polling, only files
+        which are due, or among the @changed_filenames reported by a
+        watcher, are checked; the rest have their age brought up to date
+        from what we last saw. Files among the @closed_filenames were
+        closed after writing, and so are done being written.
 
+        Returns the same dict of StatusRecords every time, updated in
+        place, so callers should copy anything they want to compare with
+        the next tick.
+        """
         now = time.time()
+        if self._state_snapshot:
+            self._state_snapshot.save_if_due(now)
+        if self._worker_pool:
+            self._collect_checks(0)
+        filenames = self._select_filenames_to_check(now, changed_filenames)
+        closed_filenames = closed_filenames or ()
+        if self._worker_pool:
+            self._check_files_concurrently(filenames, now, closed_filenames)
+        else:
+            for filename in filenames:
+                self._record_check(filename,
+                                   self._check_file(filename, now, filename in closed_filenames))
+        if self._metrics:
+            self._record_tick_stat_seconds()
+
+        if self._classifier:
+            self._classify_records(now)
+            return self._records
+
+        in_flight = self._in_flight
         for filename in self._filenames:
-            status = {
-                'any-info': False,
-                'age-seconds': None,
-                'is-success': None
-            }
+            record = self._records[filename]
+            record.is_stale = filename in in_flight
+            if record.modified_time is not None and record.checked_time != now:
+                record.age_seconds = now - record.modified_time
+                self._compute_status_code(record)
+
+        return self._records
+
+    def export_state(self):
+        """
+        Describe what we know of every file which has been seen, for
+        saving: its filename, the path last checked, the key of its
+        patterns, the fingerprint its cached scan result is good for, if
+        any, its modified time, whether it succeeded, its failure line,
+        and with the content detect mode, the fingerprint and digest its
+        content was last hashed at, if known.
+        """
+        state = []
+        for filename in self._filenames:
+            record = self._records[filename]
+            if not record.any_info or record.is_writing:
+                continue
+            path = record.newest_filename or filename
+            entry = self._success_cache.peek(path)
+            content = None
+            content_state = self._content_states.get(filename)
+            if (content_state and content_state[0] == path and
+                    content_state[3] == record.modified_time):
+                content = content_state[1:3]
+            state.append((filename, path, self._pattern_keys[filename],
+                          entry[0] if entry else None, record.modified_time,
+                          record.is_success, record.failure_line, content))
+
+        return state
+
+    def import_state(self, state):
+        """
+        Take up @state, as returned by export_state, perhaps in an earlier
+        run, for files which are watched with the same patterns and haven't
+        been checked yet. They show as last seen until their first check,
+        which only scans them again if their fingerprint changed, and with
+        the content detect mode, only counts them as changed if their
+        digest did. Returns the set of filenames taken up.
+        """
+        filenames = set()
+        for (filename, path, pattern_key, fingerprint, modified_time, is_success,
+             failure_line, content) in state:
+            record = self._records.get(filename)
+            if (record is None or record.checked_time is not None or
+                    self._pattern_keys[filename] != pattern_key):
+                continue
+            if fingerprint is not None and filename in self._matchers:
+                self._success_cache.put(path, fingerprint, (is_success, failure_line))
+            if content is not None and self._detect_modes[filename] == constants.DetectModes.CONTENT:
+                (content_fingerprint, content_digest) = content
+                self._content_states[filename] = (path, content_fingerprint, content_digest,
+                                                  modified_time)
+            record.any_info = True
+            record.modified_time = modified_time
+            record.is_success = is_success
+            record.failure_line = failure_line
+            if filename in self._directory_indexes:
+                record.newest_filename = path
+            record.age_seconds = time.time() - modified_time
+            self._compute_status_code(record)
+            if self._classifier:
+                self._classifier.update(self._indexes[filename], modified_time, is_success)
+            filenames.add(filename)
+
+        return filenames
 
-            if os.path.exists(filename):
-                stat = os.stat(filename);
-                status['any-info'] = True
-                status['age-seconds'] = now - stat.st_mtime
-                status['is-success'] = self._file_is_success(filename)
+    def _classify_records(self, now):
+        for filename in self._stale_filenames - self._in_flight:
+            if filename in self._records:
+                self._records[filename].is_stale = False
+        for filename in self._in_flight:
+            if filename in self._records:
+                self._records[filename].is_stale = True
+        self._stale_filenames = set(self._in_flight)
 
-            self._compute_status_code(status)
+        (states, changed) = self._classifier.classify(now)
+        for index in changed:
+            record = self._records[self._filenames[index]]
+            record.state = int(states[index])
+            if record.modified_time is not None:
+                record.age_seconds = now - record.modified_time
 
-            statuses[filename] = status
+    def _select_filenames_to_check(self, now, changed_filenames):
+        if self._max_poll_seconds is None:
+            return [filename for filename in self._filenames
+                    if filename not in self._in_flight]
 
-        return statuses
+        filenames = self._check_scheduler.pop_due(now)
+        if changed_filenames:
+            due = set(filenames)
+            for filename in changed_filenames:
+                if filename not in due and filename in self._scan_modes:
+                    self._check_scheduler.cancel(filename)
+                    filenames.append(filename)
+
+        return [filename for filename in filenames
+                if filename not in self._in_flight]
+
+    def _record_check(self, filename, check):
+        """
+        Bring the record of @filename up to date in place with the values
+        of a check, as returned by _check_file, and schedule the file's
+        next check sooner if it changed or later if it didn't.
+        """
+        (now, any_info, modified_time, is_success, failure_line, is_writing, stable_time,
+         newest_filename, scan_seconds) = check
+        record = self._records[filename]
+        was_checked = record.checked_time is not None
+        was_writing = record.is_writing
+        previous_modified_time = record.modified_time
+        is_changed = (record.any_info != any_info or
+                      record.modified_time != modified_time or
+                      record.is_success != is_success or
+                      record.failure_line != failure_line or
+                      record.is_writing != is_writing or
+                      record.newest_filename != newest_filename)
+
+        record.checked_time = now
+        record.any_info = any_info
+        record.modified_time = modified_time
+        record.age_seconds = None if modified_time is None else now - modified_time
+        record.is_success = is_success
+        record.failure_line = failure_line
+        record.is_writing = is_writing
+        record.stable_time = stable_time
+        record.newest_filename = newest_filename
+        record.scan_seconds = scan_seconds
+        record.is_stale = False
+        self._compute_status_code(record)
+
+        if self._classifier:
+            self._classifier.update(self._indexes[filename], modified_time, is_success, is_writing)
+        if self._history:
+            self._record_history(filename, was_writing, previous_modified_time, record, now)
+        if self._max_poll_seconds is None:
+            return
+
+        poll_seconds = self._min_poll_seconds
+        if was_checked and not is_changed:
+            poll_seconds = min(self._poll_seconds[filename] * self._poll_backoff,
+                               self._max_poll_seconds)
+        self._poll_seconds[filename] = poll_seconds
+        next_check_time = now + poll_seconds
+        if is_writing:
+            next_check_time = min(next_check_time, stable_time)
+        self._check_scheduler.schedule(filename, next_check_time)
+
+    def _record_history(self, filename, was_writing, previous_modified_time, record, now):
+        """
+        Record a rebuild once the file settles with a new modified time,
+        along with how long we saw it being written, if we did.
+        """
+        if record.is_writing:
+            if not was_writing:
+                self._write_start_times[filename] = now
+            return
+        if record.modified_time is None:
+            return
+        if previous_modified_time == record.modified_time and not was_writing:
+            return
+        if record.modified_time == self._history.get_last_time(filename):
+            # Written again with the same content.
+            self._write_start_times.pop(filename, None)
+            return
+
+        duration = None
+        if filename in self._write_start_times:
+            duration = now - self._write_start_times.pop(filename)
+        self._history.record(filename, record.modified_time, record.is_success, duration)
+
+    def _check_files_concurrently(self, filenames, now, closed_filenames):
+        """
+        Fan the checks out to our workers, waiting no longer than the tick
+        deadline. A file still being checked keeps its previous status,
+        marked as stale, and isn't checked again until that finishes.
+        """
+        for filename in filenames:
+            is_closed = filename in closed_filenames
+            if not self._is_scanning_only_on_workers:
+                self._in_flight.add(filename)
+                self._worker_pool.submit(filename, self._check_file, filename, now, is_closed)
+                continue
+
+            (path, stat, newest_filename) = self._stat_file(filename)
+            if self._is_scan_due(filename, path, stat):
+                self._in_flight.add(filename)
+                self._worker_pool.submit(filename, self._check_stat, filename, path, stat,
+                                         newest_filename, now, is_closed)
+            else:
+                self._record_check(filename, self._check_stat(filename, path, stat,
+                                                              newest_filename, now, is_closed))
+        self._collect_checks(now + self._tick_deadline_seconds)
+
+    def _collect_checks(self, deadline):
+        while self._in_flight:
+            result = self._worker_pool.collect(deadline - time.time())
+            if not result:
+                break
+
+            (filename, check, exc_info) = result
+            self._in_flight.discard(filename)
+            if filename in self._abandoned_filenames:
+                self._abandoned_filenames.discard(filename)
+                continue
+            if exc_info:
+                raise exc_info[1], None, exc_info[2]
+            self._record_check(filename, check)
+
+    def _record_tick_stat_seconds(self):
+        """
+        Record the time spent in stats since the last tick, including that
+        of checks which workers finished in between.
+        """
+        with self._stat_lock:
+            if not self._tick_stat_count:
+                return
+            stat_seconds = self._tick_stat_seconds
+            self._tick_stat_seconds = 0.0
+            self._tick_stat_count = 0
+        self._metrics.record('stat-seconds', stat_seconds)
+
+    def _check_file(self, filename, now, is_closed=False):
+        """
+        Check @filename, returning plain values rather than a record, so
+        that no object is made per check and workers leave the records to
+        the main thread: the time checked, whether there's any info, the
+        modified time, whether it succeeded, the failure line, whether
+        it's being written and when it will be stable, the newest file
+        of a directory, and how long the scan took.
+        """
+        (path, stat, newest_filename) = self._stat_file(filename)
+
+        return self._check_stat(filename, path, stat, newest_filename, now, is_closed)
+
+    def _stat_file(self, filename):
+        """
+        Stat @filename, or the newest file of it if it's a directory.
+        Returns the path statted, its stat or None if it's missing, and
+        the newest file of a directory.
+        """
+        (path, newest_filename) = (filename, None)
+        stat_start_time = time.time()
+        if filename in self._directory_indexes:
+            (path, stat) = self._directory_indexes[filename].refresh()
+            newest_filename = path and intern(path)
+        else:
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                stat = None
+        if self._metrics:
+            stat_seconds = time.time() - stat_start_time
+            with self._stat_lock:
+                self._tick_stat_seconds += stat_seconds
+                self._tick_stat_count += 1
+
+        return (path, stat, newest_filename)
+
+    def _check_stat(self, filename, path, stat, newest_filename, now, is_closed):
+        """
+        Finish checking @filename given what _stat_file found, returning
+        the same values as _check_file.
+        """
+        (any_info, modified_time, is_success, failure_line) = (False, None, None, None)
+        (is_writing, stable_time, scan_seconds) = (False, None, None)
+
+        if stat:
+            any_info = True
+            modified_time = stat.st_mtime
+            if self._quiet_period_seconds > 0:
+                stable_time = self._observe_writing(filename, path, stat, now, is_closed)
+                is_writing = stable_time is not None
+            if self._detect_modes[filename] == constants.DetectModes.CONTENT:
+                modified_time = self._detect_content_change(filename, path, stat, is_writing)
+            if not is_writing:
+                scan_start_time = time.time()
+                (is_success, failure_line) = self._check_patterns(filename, path, stat)
+                scan_seconds = time.time() - scan_start_time
+
+        return (now, any_info, modified_time, is_success, failure_line, is_writing, stable_time,
+                newest_filename, scan_seconds)
+
+    def _is_scan_due(self, filename, path, stat):
+        """
+        Find whether checking the file at @path would read it, because
+        its content must be hashed or its cached scan result is out of
+        date.
+        """
+        if not stat:
+            return False
+
+        fingerprint = cache.fingerprint(stat)
+        if self._detect_modes[filename] == constants.DetectModes.CONTENT:
+            previous = self._content_states.get(filename)
+            if not previous or previous[0] != path or previous[1] != fingerprint:
+                return True
+        if filename not in self._matchers:
+            return False
+
+        entry = self._success_cache.peek(path)
+
+        return not entry or entry[0] != fingerprint
+
+    def _observe_writing(self, filename, path, stat, now, is_closed):
+        """
+        Return when the file at @path will be stable if it's still being
+        written, that is its size or modified time has changed within the
+        quiet period, or None if it isn't. A change seen between checks
+        counts from when we saw it, in case the writer's clock is behind
+        ours; a close after writing ends it.
+        """
+        observation = (path, stat.st_size, stat.st_mtime)
+        previous = self._write_observations.get(filename)
+        if is_closed:
+            last_write_time = None
+        elif previous is None:
+            last_write_time = stat.st_mtime
+        elif previous[0] != observation:
+            last_write_time = max(stat.st_mtime, now)
+        else:
+            last_write_time = previous[1]
+        self._write_observations[filename] = (observation, last_write_time)
+
+        if last_write_time is not None and now < last_write_time + self._quiet_period_seconds:
+            return last_write_time + self._quiet_period_seconds
+
+        return None
+
+    def _detect_content_change(self, filename, path, stat, is_writing):
+        """
+        Find when the content of the file at @path last changed, hashing it
+        only when its fingerprint has changed. A file written again with
+        the same bytes keeps its earlier modified time and scan result. A
+        file still being written is left alone until it settles.
+        """
+        fingerprint = cache.fingerprint(stat)
+        previous = self._content_states.get(filename)
+        if previous and previous[0] != path:
+            previous = None
+        if previous and previous[1] == fingerprint:
+            return previous[3]
+        if is_writing:
+            return previous[3] if previous else stat.st_mtime
+
+        try:
+            content_digest = scanner.digest(path)
+        except EnvironmentError:
+            return stat.st_mtime
+        if self._metrics:
+            self._metrics.record('scan-bytes', stat.st_size)
+
+        modified_time = stat.st_mtime
+        if previous and previous[2] == content_digest:
+            modified_time = previous[3]
+            entry = self._success_cache.peek(path)
+            if entry and entry[0] == previous[1]:
+                self._success_cache.put(path, fingerprint, entry[1])
+        self._content_states[filename] = (path, fingerprint, content_digest, modified_time)
+
+        return modified_time
+
+    def get_transition_time(self, status):
+        """
+        Find when @status will next change state purely through aging, or
+        None if it won't. A file being written is due to be scanned once
+        it has been quiet for long enough.
+        """
+        if status.state == constants.States.WRITING:
+            return status.stable_time
+        elif status.state == constants.States.NEW:
+            return status.modified_time + self._new_age_seconds
+        elif status.state == constants.States.YOUNG:
+            return status.modified_time + self._young_age_seconds
+
+        return None
 
     def _compute_status_code(self, status):
         state = constants.States.NO_INFO
-        if not status['any-info']:
+        if not status.any_info:
             state = constants.States.NO_INFO
-        elif not status['is-success']:
+        elif status.is_writing:
+            state = constants.States.WRITING
+        elif not status.is_success:
             state = constants.States.ERROR
         else:
-            if status['age-seconds'] < self._new_age_seconds:
+            if status.age_seconds < self._new_age_seconds:
                 state = constants.States.NEW
-            elif status['age-seconds'] < self._young_age_seconds:
+            elif status.age_seconds < self._young_age_seconds:
                 state = constants.States.YOUNG
             else:
                 state = constants.States.OLD
 
-        status['state'] = state
+        status.state = state
+
+    def _check_patterns(self, filename, path, stat):
+        """
+        Check the file at @path against the patterns of the entry
+        @filename, which differ for a directory's newest file. Returns
+        whether it succeeded, and the first line to match a failure
+        pattern, if any.
+        """
+        if filename not in self._matchers:
+            return (True, None)
+
+        fingerprint = cache.fingerprint(stat)
+        result = self._success_cache.get(path, fingerprint)
+        if result is None:
+            scan_start_time = time.time()
+            result = self._scan_for_success(filename, path, stat)
+            self._success_cache.put(path, fingerprint, result)
+            if self._metrics:
+                self._metrics.record('scan-seconds', time.time() - scan_start_time)
 
-    def _file_is_success(self, filename):
-        if filename not in self._success_patterns:
-            return True
+        return result
 
-        pattern = self._success_patterns[filename]
-        is_success = False
-        with open(filename, 'r') as f:
-            while True:
-                line = f.readline()
-                if not line:
-                    break
-                line = line.rstrip()
-                if pattern.search(line):
-                    is_success = True
-                    break
+    def _scan_for_success(self, filename, path, stat):
+        matcher = self._matchers[filename]
+        if self._scan_modes[filename] == constants.ScanModes.INCREMENTAL:
+            (is_success_seen, failure_line) = self._scan_appended_for_success(filename, path, stat)
+        elif self._success_anchors[filename] == constants.SuccessAnchors.TAIL:
+            (is_success_seen, failure_line, bytes_read) = scanner.search_tail(
+                path, matcher, self._tail_limit_bytes[filename])
+            if self._metrics:
+                self._metrics.record('scan-bytes', bytes_read)
+        else:
+            (is_success_seen, failure_line, offset) = scanner.search(path, matcher)
+            if self._metrics:
+                self._metrics.record('scan-bytes', stat.st_size)
+
+        is_success = ((is_success_seen or not matcher.has_success_patterns()) and
+                      failure_line is None)
+
+        return (is_success, failure_line)
+
+    def _scan_appended_for_success(self, filename, path, stat):
+        """
+        Scan only the bytes appended since our last look, assuming the file
+        only grows. A new inode or a smaller size means the file was
+        rotated or truncated, so we start again from the beginning.
+        """
+        progress = self._scan_progress.get(path)
+        if (not progress or
+                progress['device'] != stat.st_dev or
+                progress['inode'] != stat.st_ino or
+                progress['size'] > stat.st_size):
+            progress = {
+                'device': stat.st_dev,
+                'inode': stat.st_ino,
+                'size': 0,
+                'offset': 0,
+                'is-success': False,
+                'failure-line': None
+            }
 
-        return is_success
+        # Once a failure is seen, or a success with no failures to rule out,
+        # nothing appended can change the outcome.
+        matcher = self._matchers[filename]
+        if progress['failure-line'] is None and (
+                matcher.has_failure_patterns() or not progress['is-success']):
+            (is_success, failure_line, offset) = scanner.search(path,
+                                                                matcher,
+                                                                progress['offset'],
+                                                                progress['is-success'],
+                                                                is_complete_lines_only=True)
+            if self._metrics:
+                self._metrics.record('scan-bytes', stat.st_size - progress['offset'])
+            progress['is-success'] = is_success
+            progress['failure-line'] = failure_line
+            progress['offset'] = offset
+        progress['size'] = stat.st_size
+        self._scan_progress[path] = progress
 
+        return (progress['is-success'], progress['failure-line'])
@@ -0,0 +1,241 @@
+import errno
+import json
+import os
+import select
+import signal
+import socket
+
+import constants
+from frontend import Frontend
+from watcher import PollingWatcher
+
+
+class StatusDaemon(Frontend):
+    """
+    Class to own the one Status engine on a machine and publish what it
+    finds over a Unix domain socket, so that any number of dashboards can
+    share a single round of stats and scans.
+
+    Messages are newline delimited JSON. Each client is sent a snapshot
+    of every cell and status when it connects, and after that a diff
+    holding only the statuses which changed. Age alone isn't a change:
+    clients hear about it once the file ages into a new state. When the
+    cells change, as on reloading the config, every client is sent a
+    new snapshot instead.
+    """
+
+    # Give up on a client which won't take a message within this long,
+    # rather than stalling every other client behind it.
+    SEND_TIMEOUT_SECONDS = 1.0
+
+    LISTEN_BACKLOG = 16
+
+    # Status fields which change on every check, without the state of the
+    # file having changed.
+    VOLATILE_KEYS = ('age-seconds', 'checked-time', 'scan-seconds')
+
+    def __init__(self):
+        super(StatusDaemon, self).__init__()
+        self._socket_filename = None
+        self._listener = None
+        self._clients = []
+        self._statuses = {}
+        self._is_cells_changed = False
+        self._log = None
+
+    def set_socket_filename(self, socket_filename):
+        self._socket_filename = socket_filename
+
+    def set_log(self, log):
+        self._log = log
+
+    def run(self):
+        assert self._status, "no status helper object set."
+        assert self._socket_filename, "no socket filename set."
+        if not self._watcher:
+            self._watcher = PollingWatcher()
+
+        self._listen()
+
+        def stop_handler(signal, frame):
+            self.stop()
+        signal.signal(signal.SIGTERM, stop_handler)
+
+        try:
+            self._run_ticks()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._close_sockets()
+
+    def _listen(self):
+        """
+        Bind our socket, first removing one left behind by a daemon which
+        is no longer running. One which is still being served is an error.
+        """
+        if os.path.exists(self._socket_filename):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self._socket_filename)
+            except socket.error as exception:
+                if exception.args[0] != errno.ECONNREFUSED:
+                    raise
+                os.unlink(self._socket_filename)
+            else:
+                raise Exception('a daemon is already serving %s' % self._socket_filename)
+            finally:
+                probe.close()
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self._socket_filename)
+        self._listener.listen(StatusDaemon.LISTEN_BACKLOG)
+
+    def _close_sockets(self):
+        for client in self._clients:
+            client.close()
+        self._clients = []
+        if self._listener:
+            self._listener.close()
+            self._listener = None
+            os.unlink(self._socket_filename)
+
+    def _get_wake_files(self):
+        return [self._listener] + self._clients + super(StatusDaemon, self)._get_wake_files()
+
+    def _handle_wake(self):
+        (readable, _, _) = select.select([self._listener] + self._clients, [], [], 0)
+        for sock in readable:
+            if sock is self._listener:
+                self._accept_client()
+            else:
+                # Clients have nothing to say, so this is a hangup.
+                try:
+                    data = sock.recv(4096)
+                except socket.error:
+                    data = ''
+                if not data:
+                    self._drop_client(sock)
+
+    def _accept_client(self):
+        try:
+            (client, _) = self._listener.accept()
+        except socket.error:
+            return
+        client.settimeout(StatusDaemon.SEND_TIMEOUT_SECONDS)
+        self._clients.append(client)
+        data = self._encode_snapshot()
+        if data:
+            self._send(client, data)
+
+    def _drop_client(self, client):
+        if client in self._clients:
+            self._clients.remove(client)
+        client.close()
+
+    def _encode_snapshot(self):
+        return self._encode({
+            'type': constants.MessageTypes.SNAPSHOT,
+            'cells': self._cells,
+            'statuses': self._statuses
+        })
+
+    def _encode(self, message):
+        """
+        Encode @message once, however many clients it goes to. Cells and
+        statuses which can't be encoded, such as those with a filename
+        which isn't UTF-8, are left out with a warning, rather than taking
+        down the daemon and every dashboard sharing it.
+        """
+        try:
+            return json.dumps(message, sort_keys=True) + '\n'
+        except (TypeError, ValueError, UnicodeError):
+            pass
+
+        message = dict(message)
+        message['statuses'] = dict((filename, status)
+                                   for (filename, status) in message['statuses'].iteritems()
+                                   if self._is_encodable(filename, status))
+        if 'cells' in message:
+            message['cells'] = [cell for cell in message['cells']
+                                if self._is_encodable(cell['filename'], cell)]
+        elif not message['statuses']:
+            return None
+        try:
+            return json.dumps(message, sort_keys=True) + '\n'
+        except (TypeError, ValueError, UnicodeError) as exception:
+            if self._log:
+                self._log.warning('could not encode a %s message: %s', message['type'], exception)
+            return None
+
+    def _is_encodable(self, filename, value):
+        try:
+            json.dumps({filename: value})
+        except (TypeError, ValueError, UnicodeError) as exception:
+            if self._log:
+                self._log.warning('not publishing %r: %s', filename, exception)
+            return False
+
+        return True
+
+    def _broadcast(self, data):
+        if not data:
+            return
+        for client in list(self._clients):
+            self._send(client, data)
+
+    def _send(self, client, data):
+        try:
+            client.sendall(data)
+        except (socket.error, socket.timeout):
+            self._drop_client(client)
+
+    def _on_cell_added(self, cell):
+        self._is_cells_changed = True
+
+    def _on_cell_removed(self, filename):
+        self._statuses.pop(filename, None)
+        self._is_cells_changed = True
+
+    def _update_statuses(self):
+        """
+        Send clients the statuses which changed, or a new snapshot if the
+        cells did.
+        """
+        statuses = self._status.get_statuses(self._changed_filenames,
+                                             self._watcher.get_closed_filenames())
+        self._any_stale = False
+        changed = {}
+        for cell in self._cells:
+            filename = cell['filename']
+            status = statuses.get(filename)
+            if not status:
+                continue
+            self._follow_status(filename, status)
+
+            # Records are updated in place, so keep what we sent as a dict.
+            status = status.to_dict()
+            if not self._has_changed(self._statuses.get(filename), status):
+                continue
+            self._statuses[filename] = status
+            changed[filename] = status
+
+        if self._is_cells_changed:
+            self._is_cells_changed = False
+            if self._clients:
+                self._broadcast(self._encode_snapshot())
+        elif changed and self._clients:
+            self._broadcast(self._encode({
+                'type': constants.MessageTypes.DIFF,
+                'statuses': changed
+            }))
+
+        return len(changed) > 0
+
+    def _has_changed(self, previous, status):
+        if previous is None:
+            return True
+        for key, value in status.iteritems():
+            if key not in StatusDaemon.VOLATILE_KEYS and previous.get(key) != value:
+                return True
+
+        return False
@@ -0,0 +1,65 @@
+import constants
+
+
+class StatusRecord(object):
+    """
+    Class to hold what we know of one watched file. Status keeps one per
+    file and brings it up to date in place every tick, so slots keep
+    them small and cheap to touch.
+
+    `state` is one of the integer constants.States; to_dict gives the
+    hyphenated, named form used in JSON.
+    """
+
+    __slots__ = ('checked_time', 'any_info', 'modified_time', 'age_seconds',
+                 'is_success', 'scan_seconds', 'newest_filename', 'is_stale',
+                 'state', 'failure_line', 'is_writing', 'stable_time')
+
+    # Attributes and the keys they're known by outside the process.
+    KEYS = (('checked_time', 'checked-time'),
+            ('any_info', 'any-info'),
+            ('modified_time', 'modified-time'),
+            ('age_seconds', 'age-seconds'),
+            ('is_success', 'is-success'),
+            ('scan_seconds', 'scan-seconds'),
+            ('newest_filename', 'newest-filename'),
+            ('is_stale', 'is-stale'),
+            ('failure_line', 'failure-line'),
+            ('is_writing', 'is-writing'),
+            ('stable_time', 'stable-time'))
+
+    def __init__(self):
+        self.checked_time = None
+        self.any_info = False
+        self.modified_time = None
+        self.age_seconds = None
+        self.is_success = None
+        self.scan_seconds = None
+        self.newest_filename = None
+        self.is_stale = False
+        self.state = constants.States.NO_INFO
+        self.failure_line = None
+        self.is_writing = False
+        self.stable_time = None
+
+    def to_dict(self):
+        status = {}
+        for (attribute, key) in StatusRecord.KEYS:
+            value = getattr(self, attribute)
+            if isinstance(value, str):
+                # Failure lines and filenames come from disk, so needn't be UTF-8.
+                value = value.decode('utf-8', 'replace')
+            status[key] = value
+        status['state'] = constants.STATE_NAMES[self.state]
+
+        return status
+
+    @staticmethod
+    def from_dict(status):
+        record = StatusRecord()
+        for (attribute, key) in StatusRecord.KEYS:
+            if key in status:
+                setattr(record, attribute, status[key])
+        record.state = constants.STATE_CODES[status['state']]
+
+        return record
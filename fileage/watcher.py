@@ -0,0 +1,350 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+
+WATCHER_AUTO = 'auto'
+WATCHER_INOTIFY = 'inotify'
+WATCHER_POLL = 'poll'
+
+
+def create_watcher(kind=None):
+    """
+    Build the best watcher available for @kind: 'auto' prefers inotify
+    and falls back to polling, 'inotify' insists upon it.
+    """
+    kind = kind or WATCHER_AUTO
+    if kind not in (WATCHER_AUTO, WATCHER_INOTIFY, WATCHER_POLL):
+        raise Exception('unknown watcher: %s' % kind)
+
+    if kind != WATCHER_POLL:
+        if InotifyWatcher.is_available():
+            try:
+                return InotifyWatcher()
+            except OSError:
+                if kind == WATCHER_INOTIFY:
+                    raise
+        elif kind == WATCHER_INOTIFY:
+            raise Exception('inotify is not available on this platform')
+
+    return PollingWatcher()
+
+
+def select_readable(files, timeout):
+    """
+    Wait up to @timeout seconds, or forever if None, for any of @files to
+    become readable, treating an interrupting signal as a timeout.
+    """
+    if timeout is not None:
+        timeout = max(timeout, 0)
+    try:
+        (readable, _, _) = select.select(files, [], [], timeout)
+    except select.error as exception:
+        if exception.args[0] != errno.EINTR:
+            raise
+        readable = []
+
+    return readable
+
+
+class PollingWatcher(object):
+    """
+    Class to wait between status checks by sleeping, for platforms
+    without a change notification facility.
+    """
+
+    def __init__(self):
+        self._filenames = []
+
+    def add_filename(self, filename):
+        self._filenames.append(filename)
+
+    def add_directory(self, directory):
+        self._filenames.append(directory)
+
+    def remove_filename(self, filename):
+        self._filenames.remove(filename)
+
+    def remove_directory(self, directory):
+        self._filenames.remove(directory)
+
+    def is_event_driven(self):
+        return False
+
+    def covers_all_changes(self):
+        return False
+
+    def wait(self, timeout, wake_files=()):
+        """
+        Sleep for @timeout seconds, or until one of @wake_files is readable.
+        We can't know what changed meanwhile, so return None rather than a
+        set of filenames.
+        """
+        if wake_files:
+            select_readable(list(wake_files), timeout)
+        else:
+            time.sleep(timeout)
+        return None
+
+    def get_closed_filenames(self):
+        return ()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    Class to block until a watched file changes, using Linux inotify
+    through ctypes.
+
+    We watch the parent directory of each file rather than the file
+    itself, so that files which are missing, deleted or replaced by a
+    rename are still noticed.
+    """
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+
+    IN_NONBLOCK = 0x00000800
+    IN_CLOEXEC = 0x00080000
+
+    DIRECTORY_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE |
+                      IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+                      IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    DIRECTORY_GONE_MASK = IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF
+
+    EVENT_HEADER = struct.Struct('iIII')
+    READ_SIZE = 64 * 1024
+
+    _libc = None
+
+    @staticmethod
+    def _load_libc():
+        if InotifyWatcher._libc is not None:
+            return InotifyWatcher._libc or None
+
+        libc = False
+        if sys.platform.startswith('linux'):
+            libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+            try:
+                libc = ctypes.CDLL(libc_name, use_errno=True)
+            except OSError:
+                libc = False
+            if libc and not hasattr(libc, 'inotify_init1'):
+                libc = False
+        InotifyWatcher._libc = libc
+
+        return libc or None
+
+    @staticmethod
+    def is_available():
+        return InotifyWatcher._load_libc() is not None
+
+    def __init__(self):
+        self._libc = InotifyWatcher._load_libc()
+        assert self._libc, "inotify is not available."
+
+        self._fd = self._libc.inotify_init1(InotifyWatcher.IN_NONBLOCK |
+                                            InotifyWatcher.IN_CLOEXEC)
+        if self._fd < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number))
+
+        self._filenames = []
+        self._names = {}
+        self._directory_names = {}
+        self._dirnames = {}
+        self._wd_dirnames = {}
+        self._pending_dirnames = set()
+        self._unwatchable_dirnames = set()
+        self._closed_filenames = set()
+
+    def add_filename(self, filename):
+        self._filenames.append(filename)
+
+        paths = [os.path.abspath(filename)]
+        real_path = os.path.realpath(filename)
+        if real_path != paths[0]:
+            paths.append(real_path)
+
+        for path in paths:
+            (dirname, basename) = os.path.split(path)
+            self._names.setdefault((dirname, basename), set()).add(filename)
+            if dirname not in self._dirnames:
+                self._dirnames[dirname] = None
+                self._pending_dirnames.add(dirname)
+
+        self._add_pending_watches()
+
+    def add_directory(self, directory):
+        """
+        Report any change to an entry directly within @directory as a
+        change to @directory. Subdirectories aren't watched, so changes
+        deeper in the tree are left to the timeout.
+        """
+        self._filenames.append(directory)
+
+        dirname = os.path.abspath(directory)
+        self._directory_names.setdefault(dirname, set()).add(directory)
+        if dirname not in self._dirnames:
+            self._dirnames[dirname] = None
+            self._pending_dirnames.add(dirname)
+
+        self._add_pending_watches()
+
+    def remove_filename(self, filename):
+        """
+        Stop reporting changes to @filename. Directory watches are left in
+        place, since other files may share them, and cost nothing once
+        none of their names are wanted.
+        """
+        self._filenames.remove(filename)
+        for key, names in self._names.items():
+            names.discard(filename)
+            if not names:
+                del self._names[key]
+
+    def remove_directory(self, directory):
+        self._filenames.remove(directory)
+        for dirname, names in self._directory_names.items():
+            names.discard(directory)
+            if not names:
+                del self._directory_names[dirname]
+
+    def is_event_driven(self):
+        return True
+
+    def covers_all_changes(self):
+        """
+        Indicate whether every change will be reported as an event, so that
+        no polling is needed. Missing or unwatchable directories, and the
+        subdirectories of watched directories, still need to be polled.
+        """
+        return not (self._pending_dirnames or
+                    self._unwatchable_dirnames or
+                    self._directory_names)
+
+    def fileno(self):
+        return self._fd
+
+    def wait(self, timeout, wake_files=()):
+        """
+        Block for up to @timeout seconds, or indefinitely if None, returning
+        early as soon as any watched file changes or one of @wake_files is
+        readable. Returns the
+        set of changed filenames, which is empty if nothing changed.
+        """
+        changed = self._add_pending_watches()
+        self._closed_filenames = set()
+
+        if not changed:
+            readable = select_readable([self._fd] + list(wake_files), timeout)
+            if self._fd in readable:
+                changed.update(self._read_events())
+
+        return changed
+
+    def get_closed_filenames(self):
+        """
+        Find which of the files that changed in the last wait were closed
+        after writing, and so are likely complete.
+        """
+        return self._closed_filenames
+
+    def close(self):
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        self._fd = None
+
+    def _add_pending_watches(self):
+        """
+        Watch directories which didn't exist last time we looked, returning
+        the filenames within any which have since appeared.
+        """
+        changed = set()
+        for dirname in list(self._pending_dirnames):
+            wd = self._libc.inotify_add_watch(self._fd, dirname,
+                                              InotifyWatcher.DIRECTORY_MASK)
+            if wd < 0:
+                error_number = ctypes.get_errno()
+                if error_number not in (errno.ENOENT, errno.ENOTDIR):
+                    # Out of watches or not permitted; we'll have to poll it.
+                    self._pending_dirnames.discard(dirname)
+                    self._unwatchable_dirnames.add(dirname)
+                continue
+
+            self._pending_dirnames.discard(dirname)
+            self._dirnames[dirname] = wd
+            self._wd_dirnames[wd] = dirname
+            changed.update(self._filenames_in_dirname(dirname))
+
+        return changed
+
+    def _read_events(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, InotifyWatcher.READ_SIZE)
+            except OSError as exception:
+                if exception.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            if not data:
+                break
+
+            offset = 0
+            while offset < len(data):
+                (wd, mask, cookie, name_length) = InotifyWatcher.EVENT_HEADER.unpack_from(data, offset)
+                offset += InotifyWatcher.EVENT_HEADER.size
+                name = data[offset:offset + name_length].rstrip('\0')
+                offset += name_length
+                changed.update(self._handle_event(wd, mask, name))
+
+        return changed
+
+    def _handle_event(self, wd, mask, name):
+        if mask & InotifyWatcher.IN_Q_OVERFLOW:
+            return self._filenames
+
+        dirname = self._wd_dirnames.get(wd)
+        if dirname is None:
+            return ()
+
+        if mask & InotifyWatcher.DIRECTORY_GONE_MASK:
+            del self._wd_dirnames[wd]
+            self._dirnames[dirname] = None
+            self._pending_dirnames.add(dirname)
+            if not mask & InotifyWatcher.IN_IGNORED:
+                self._libc.inotify_rm_watch(self._fd, wd)
+            return self._filenames_in_dirname(dirname)
+
+        changed = set(self._names.get((dirname, name), ()))
+        if mask & InotifyWatcher.IN_CLOSE_WRITE:
+            self._closed_filenames.update(changed)
+        changed.update(self._directory_names.get(dirname, ()))
+
+        return changed
+
+    def _filenames_in_dirname(self, dirname):
+        filenames = set(self._directory_names.get(dirname, ()))
+        for (name_dirname, basename), names in self._names.iteritems():
+            if name_dirname == dirname:
+                filenames.update(names)
+
+        return filenames
@@ -0,0 +1,107 @@
+import Queue
+import errno
+import fcntl
+import os
+import sys
+import threading
+
+
+class WorkerPool(object):
+    """
+    Class to run jobs on a fixed set of daemon threads, handing back each
+    result, or the exception it raised, as it finishes.
+
+    A byte is written to a pipe as each job finishes, so that an event
+    loop can select on it alongside its other files and collect results
+    as soon as they're ready rather than polling for them.
+    """
+
+    def __init__(self, worker_count):
+        self._jobs = Queue.Queue()
+        self._results = Queue.Queue()
+        self._threads = []
+        (self._wake_reader, self._wake_writer) = os.pipe()
+        for fd in (self._wake_reader, self._wake_writer):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        for index in range(worker_count):
+            thread = threading.Thread(target=self._work,
+                                      name='fileage-worker-%d' % index)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, function, *args):
+        self._jobs.put((key, function, args))
+
+    def get_wake_fd(self):
+        """
+        Return a file descriptor which is readable once a job has finished
+        and until its result is collected.
+        """
+        return self._wake_reader
+
+    def collect(self, timeout):
+        """
+        Wait up to @timeout seconds for a job to finish. Returns a tuple of
+        the job's key, its result and `sys.exc_info()` if it raised, or
+        None if nothing finished in time.
+        """
+        self._drain_wake()
+        try:
+            if timeout <= 0:
+                return self._results.get_nowait()
+            return self._results.get(True, timeout)
+        except Queue.Empty:
+            return None
+
+    def close(self, timeout=1.0):
+        """
+        Stop the workers, dropping jobs which haven't started and waiting
+        up to @timeout seconds for each to finish its current one. A worker
+        stuck on a hung mount is left behind.
+        """
+        try:
+            while True:
+                self._jobs.get_nowait()
+        except Queue.Empty:
+            pass
+        for thread in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        # A worker left behind may yet write to the pipe, so keep it open.
+        if self._wake_reader is not None and not any(thread.is_alive()
+                                                     for thread in self._threads):
+            os.close(self._wake_reader)
+            os.close(self._wake_writer)
+            self._wake_reader = self._wake_writer = None
+        self._threads = []
+
+    def _drain_wake(self):
+        # A byte written after this is for a result we may collect now,
+        # which costs the caller one needless wakeup at worst.
+        try:
+            while os.read(self._wake_reader, 4096):
+                pass
+        except OSError as exception:
+            if exception.errno != errno.EAGAIN:
+                raise
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+
+            (key, function, args) = job
+            try:
+                result = (key, function(*args), None)
+            except Exception:
+                result = (key, None, sys.exc_info())
+            self._results.put(result)
+            try:
+                os.write(self._wake_writer, 'x')
+            except OSError as exception:
+                # A full pipe is readable already.
+                if exception.errno != errno.EAGAIN:
+                    raise
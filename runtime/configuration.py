@@ -13,6 +13,7 @@ class Config:
         self.deployment_home = None
         self.config = None
         self.dotfile_dirname = None
+        self.config_filenames = []
         self._dotfile_name = None
         self._cwd = None
 
@@ -82,8 +83,10 @@ class Config:
                 raise Exception('no config found: %s' % env_config_file_path)
             config_filenames.append(env_config_file_path)
 
-        self.config = ConfigParser.RawConfigParser()
-        self.config.read(config_filenames)
+        config = ConfigParser.RawConfigParser()
+        config.read(config_filenames)
+        self.config = config
+        self.config_filenames = config_filenames
 
         return self
 
@@ -97,6 +100,16 @@ class Config:
 
         return value
 
+    def get_boolean(self, *args):
+        """
+        Get one configuration property from our store as a boolean.
+        """
+        value = None
+        if self.config and self.config.has_option(*args):
+            value = self.config.getboolean(*args)
+
+        return value
+
     def get_strict(self, *args):
         """
         Get one configuration property from our store, raising an exception if missing
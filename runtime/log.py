@@ -1,13 +1,23 @@
 
+import atexit
 import binascii
+import collections
+import json
 import sys
 import os
+import threading
+import time
 from datetime import datetime
 
 
 class Log:
     """
     A class to allow logging in a standard format.
+
+    When buffered, log calls only queue their arguments in a ring buffer,
+    and a background thread formats and writes them in batches, so that
+    logging stays off the caller's hot path. Arguments are formatted
+    later, so pass values rather than objects which may yet change.
     """
     LEVEL_SILENT = 'silent'
     LEVEL_ERROR = 'error'
@@ -34,11 +44,42 @@ class Log:
         'DBG '
     ]
 
+    LEVEL_NAMES = [
+        LEVEL_SILENT,
+        LEVEL_ERROR,
+        LEVEL_WARNING,
+        LEVEL_INFO,
+        LEVEL_VERBOSE,
+        LEVEL_DEBUG
+    ]
+
+    FORMAT_TEXT = 'text'
+    FORMAT_JSON = 'json'
+
+    DEFAULT_BUFFER_SIZE = 8192
+    DEFAULT_FLUSH_SECONDS = 0.2
+    DEFAULT_BACKUP_COUNT = 3
+
     def __init__(self):
         self._level = Log.DEFAULT
         self._output_handle = sys.stdout
         self._instance_hash = Log._generate_instance_hash()
         self._script_abbrev = None
+        self._format = Log.FORMAT_TEXT
+        self._output_filename = None
+        self._max_bytes = None
+        self._backup_count = Log.DEFAULT_BACKUP_COUNT
+        self._bytes_written = 0
+        self._timestamp_second = None
+        self._timestamp_text = None
+
+        self._buffer = None
+        self._dropped_count = 0
+        self._flush_seconds = Log.DEFAULT_FLUSH_SECONDS
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer = None
+        self._is_closing = False
 
     @staticmethod
     def _generate_instance_hash():
@@ -54,21 +95,87 @@ class Log:
         if hasattr(options, 'log_level'):
             self.set_log_level(options.log_level)
 
-        if hasattr(options, 'log_filename'):
+        if getattr(options, 'log_format', None):
+            self.set_format(options.log_format)
+
+        if getattr(options, 'log_max_bytes', None):
+            self.set_max_bytes(options.log_max_bytes)
+
+        if getattr(options, 'log_filename', None):
             output_filename = options.log_filename
             self.set_output_filename(output_filename)
 
+        if not getattr(options, 'log_unbuffered', True):
+            self.set_is_buffered(True)
+
     def set_log_level(self, log_level):
         level = Log.resolve_log_level(log_level)
         if level is not None:
             self._level = level
 
     def set_output_filename(self, output_filename):
+        """
+        Log to @output_filename, moving it aside to numbered backups once
+        it grows past `max_bytes`, if set.
+        """
         output_handle = open(output_filename, 'w')
         self.set_output_handle(output_handle)
+        self._output_filename = output_filename
 
     def set_output_handle(self, output_handle):
-        self._output_handle = output_handle
+        with self._write_lock:
+            self._output_handle = output_handle
+            self._output_filename = None
+            self._bytes_written = 0
+
+    def set_format(self, format):
+        """
+        Write plain text lines, or one JSON object per message.
+        """
+        assert format in (Log.FORMAT_TEXT, Log.FORMAT_JSON), "unknown log format."
+        self._format = format
+
+    def set_max_bytes(self, max_bytes):
+        self._max_bytes = max_bytes
+
+    def set_backup_count(self, backup_count):
+        self._backup_count = backup_count
+
+    def set_flush_seconds(self, flush_seconds):
+        self._flush_seconds = flush_seconds
+
+    def set_is_buffered(self, is_buffered, buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        Hand messages to a background writer through a ring buffer of
+        @buffer_size entries. When the writer falls that far behind, the
+        oldest messages are dropped, and the number dropped is logged.
+        """
+        self.close()
+        if not is_buffered:
+            return
+
+        self._buffer = collections.deque(maxlen=buffer_size)
+        self._is_closing = False
+        self._writer = threading.Thread(target=self._run_writer, name='log-writer')
+        self._writer.daemon = True
+        self._writer.start()
+        atexit.register(self.close)
+
+    def flush(self):
+        self._drain()
+
+    def close(self):
+        """
+        Stop the background writer, if any, once it has written everything
+        logged so far.
+        """
+        if self._writer:
+            self._is_closing = True
+            self._wake.set()
+            self._writer.join()
+            self._writer = None
+        self._drain()
+        self._buffer = None
 
     def set_instance_hash(self, instance_hash):
         self._instance_hash = instance_hash
@@ -98,27 +205,128 @@ class Log:
         if level > self._level:
             return
 
-        if len(args) == 0:
-            message_string = message
-        else:
-            if len(args) == 1:
-                args = args[0]
-            message_string = message % args
-
-        message_string_lines = message_string.split("\n")
+        entry = (time.time(), level, message, args, kwargs.get('prefix'))
+        buffer = self._buffer
+        if buffer is None:
+            with self._write_lock:
+                self._write_entries([entry])
+            return
 
-        prefix = self._format_prefix(level, **kwargs)
-        for line in message_string_lines:
-            self._output_handle.write("%s  %s\n" % (prefix, line))
+        if len(buffer) == buffer.maxlen:
+            self._dropped_count += 1
+        buffer.append(entry)
+        if level <= Log.ERROR:
+            self._wake.set()
+
+    def _run_writer(self):
+        while not self._is_closing:
+            self._wake.wait(self._flush_seconds)
+            self._wake.clear()
+            self._drain()
+
+    def _drain(self):
+        with self._write_lock:
+            entries = []
+            buffer = self._buffer
+            while buffer:
+                entries.append(buffer.popleft())
+            if self._dropped_count:
+                entries.insert(0, (time.time(), Log.WARNING,
+                                   'dropped %d log messages', (self._dropped_count,), None))
+                self._dropped_count = 0
+            if entries:
+                try:
+                    self._write_entries(entries)
+                except Exception:
+                    if buffer is None:
+                        raise
+                    # Report the loss with the next batch rather than let
+                    # the writer thread die and take later messages with it.
+                    self._dropped_count += len(entries)
+
+    def _write_entries(self, entries):
+        """
+        Format @entries and write them in one go. Call with the write lock
+        held.
+        """
+        lines = []
+        for (timestamp, level, message, args, prefix) in entries:
+            message_string = self._format_message(message, args)
+
+            if self._format == Log.FORMAT_JSON:
+                record = {
+                    'time': self._format_timestamp(timestamp),
+                    'level': Log.LEVEL_NAMES[level],
+                    'script': self._script_abbrev,
+                    'instance': self._instance_hash,
+                    'message': message_string
+                }
+                if prefix is not None:
+                    record['prefix'] = prefix
+                try:
+                    line = json.dumps(record, sort_keys=True)
+                except UnicodeDecodeError:
+                    # Bytes which aren't UTF-8, so escape them.
+                    record['message'] = repr(message_string)
+                    if prefix is not None:
+                        record['prefix'] = repr(prefix)
+                    line = json.dumps(record, sort_keys=True)
+                lines.append(line + "\n")
+                continue
+
+            output_prefix = self._format_prefix(timestamp, level, prefix)
+            for line in message_string.split("\n"):
+                lines.append("%s  %s\n" % (output_prefix, line))
+
+        output = ''.join(lines)
+        self._output_handle.write(output)
+        self._output_handle.flush()
+        self._bytes_written += len(output)
+        if self._max_bytes and self._bytes_written >= self._max_bytes:
+            self._rotate()
+
+    def _format_message(self, message, args):
+        if len(args) == 0:
+            return message
+        if len(args) == 1:
+            args = args[0]
+        try:
+            return message % args
+        except Exception:
+            # A bad call shouldn't lose its message, nor those after it.
+            return 'unformattable message: %r %% %r' % (message, args)
+
+    def _rotate(self):
+        if not self._output_filename:
+            return
 
-    def _format_prefix(self, level, **kwargs):
-        timestamp = datetime.now().isoformat()
+        self._output_handle.close()
+        for index in range(self._backup_count - 1, 0, -1):
+            backup_filename = '%s.%d' % (self._output_filename, index)
+            if os.path.exists(backup_filename):
+                os.rename(backup_filename, '%s.%d' % (self._output_filename, index + 1))
+        if self._backup_count > 0:
+            os.rename(self._output_filename, '%s.1' % self._output_filename)
+        self._output_handle = open(self._output_filename, 'w')
+        self._bytes_written = 0
+
+    def _format_timestamp(self, timestamp):
+        # Most messages share their second with the one before.
+        second = int(timestamp)
+        if second != self._timestamp_second:
+            self._timestamp_second = second
+            self._timestamp_text = datetime.fromtimestamp(second).isoformat()
+
+        return '%s.%06d' % (self._timestamp_text, int((timestamp - second) * 1e6))
+
+    def _format_prefix(self, timestamp, level, prefix=None):
         level_indicator = Log.LEVEL_INDICATOR[level]
-        output_payload = [timestamp, self._script_abbrev, self._instance_hash, level_indicator]
+        output_payload = [self._format_timestamp(timestamp), self._script_abbrev,
+                          self._instance_hash, level_indicator]
         output_format = "%s %s_%s %s"
-        if 'prefix' in kwargs:
+        if prefix is not None:
             output_format = "%s %%s" % output_format
-            output_payload.append(kwargs['prefix'])
+            output_payload.append(prefix)
 
         output_string = output_format % tuple(output_payload)
 
@@ -93,6 +93,21 @@ class Runtime:
                                 dest='log_level',
                                 help='lowest log level to emit',
                                 choices=allowed_log_levels)
+        arg_parser.add_argument('--log-file',
+                                dest='log_filename',
+                                help='file to log to, instead of stdout')
+        arg_parser.add_argument('--log-format',
+                                dest='log_format',
+                                choices=[Log.FORMAT_TEXT, Log.FORMAT_JSON],
+                                help='write log lines as plain text, or as JSON objects')
+        arg_parser.add_argument('--log-max-bytes',
+                                dest='log_max_bytes',
+                                type=int,
+                                help='move the log file aside to a numbered backup once it grows this large')
+        arg_parser.add_argument('--log-unbuffered',
+                                dest='log_unbuffered',
+                                action='store_true',
+                                help='write each log message as it is logged, rather than from a background thread')
 
     @staticmethod
     def build_default(deployment_home, cwd, CommandClasses):
@@ -139,6 +154,8 @@ class Runtime:
 
         log = Log()
         log.set_options(options)
+        if hasattr(CommandClass, 'configure_log'):
+            CommandClass.configure_log(log, options)
 
         runtime.set_options(options)
         runtime.set_config(config)